@@ -1,24 +1,34 @@
 # app.py
+import hashlib
 import os
+import re
 import shutil
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 from uuid import UUID, uuid4
-from typing import Optional
+from typing import Annotated, Optional
 from datetime import date
 from decimal import Decimal
 
 from dateutil.relativedelta import relativedelta
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, BeforeValidator, ConfigDict
 
 from fastapi import (
     FastAPI, Request, Depends, Form, HTTPException, Response,
     File, UploadFile
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates 
-from sqlalchemy import create_engine, or_, select, desc
-from sqlalchemy.orm import sessionmaker, Session, joinedload 
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
+from sqlalchemy import and_, or_, select, update, delete, asc, desc, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload, raiseload
 
 from models import (
     Base, Vehicle, Employee, 
@@ -30,8 +40,13 @@ from models import (
     ParkingLot, ParkingSpot, ParkingAssignmentType
 )
 from config import settings, UPLOAD_PATH
+from database import engine, SessionLocal, get_db
+from labels import (
+    VEHICLE_TYPE_MAP, VEHICLE_STATUS_MAP, MAINTENANCE_CATEGORY_MAP,
+    INSPECTION_KIND_MAP, FEE_TYPE_MAP, ASSET_TYPE_MAP, ASSET_STATUS_MAP,
+    PARKING_STATUS_MAP
+)
 import json
-import import_data
 
 
 class InspectionReminder(BaseModel):
@@ -49,80 +64,177 @@ class MaintenanceReminder(BaseModel):
     last_maintenance_date: Optional[date]
     last_maintenance_km: Optional[int]
 
-# 翻譯字典
-VEHICLE_TYPE_MAP = {
-    "car": "小客車", "motorcycle": "機車", "van": "廂型車",
-    "truck": "貨車", "ev_scooter": "電動機車",
+# --- 翻譯過濾器 (模板用法：{{ record.kind|format_inspection_kind }}) ---
+# 列表每一列都會呼叫，所以直接把翻譯表的 __getitem__ 註冊成過濾器，
+# 查得到時只有一次 C 層級的 dict 查找，不會多建立一層 Python 函式呼叫
+class _LabelTable(dict):
+    """ 查不到翻譯時 (例如 None 或未知字串) 回傳原始值，而不是丟出 KeyError """
+    def __missing__(self, value):
+        return getattr(value, "value", value)
+
+def _labels_by_member(enum_cls, label_map):
+    """ 以 enum 成員本身為 key 建立翻譯表，查找時不必再讀取 .value """
+    # (str, Enum) 成員的 hash/比較與其字串值相同，所以傳入原始字串 (例如 "car") 也查得到
+    # 新增 enum 成員卻忘了補翻譯時，在載入時就報錯，而不是在畫面上默默顯示英文值
+    missing = [m.value for m in enum_cls if m.value not in label_map]
+    if missing:
+        raise RuntimeError(f"{enum_cls.__name__} 缺少中文翻譯: {', '.join(missing)}")
+    # 翻譯在載入時先跳脫成 Markup，渲染時 Jinja 的 autoescape 就不必再逐字掃描
+    return _LabelTable({m: escape(label_map[m.value]) for m in enum_cls})
+
+format_vehicle_type = _labels_by_member(VehicleType, VEHICLE_TYPE_MAP).__getitem__
+format_vehicle_status = _labels_by_member(VehicleStatus, VEHICLE_STATUS_MAP).__getitem__
+format_maintenance_category = _labels_by_member(MaintenanceCategory, MAINTENANCE_CATEGORY_MAP).__getitem__
+format_inspection_kind = _labels_by_member(InspectionKind, INSPECTION_KIND_MAP).__getitem__
+format_fee_type = _labels_by_member(FeeType, FEE_TYPE_MAP).__getitem__
+format_asset_type = _labels_by_member(AssetType, ASSET_TYPE_MAP).__getitem__
+format_asset_status = _labels_by_member(AssetStatus, ASSET_STATUS_MAP).__getitem__
+format_parking_status = _labels_by_member(ParkingAssignmentType, PARKING_STATUS_MAP).__getitem__
+
+# --- 狀態徽章 (HTML 在載入時就組好，渲染時只做一次 dict 查找) ---
+# 每個 enum 成員都有對應的徽章，所以直接把 dict.get 註冊成過濾器，不另包一層函式
+_BADGE_HTML = '<span class="px-2 inline-flex text-xs leading-5 font-semibold rounded-full %s">%s</span>'
+_VEHICLE_STATUS_BADGE = {
+    VehicleStatus.active: Markup(_BADGE_HTML % ("bg-green-100 text-green-800", VEHICLE_STATUS_MAP["active"])),
+    VehicleStatus.maintenance: Markup(_BADGE_HTML % ("bg-yellow-100 text-yellow-800", VEHICLE_STATUS_MAP["maintenance"])),
+    VehicleStatus.retired: Markup(_BADGE_HTML % ("bg-red-100 text-red-800", VEHICLE_STATUS_MAP["retired"])),
 }
-VEHICLE_STATUS_MAP = {
-    "active": "啟用中", "maintenance": "維修中", "retired": "已報廢",
+_ASSET_STATUS_BADGE = {
+    AssetStatus.assigned: Markup('<span class="text-green-700">✔️ %s</span>' % ASSET_STATUS_MAP["assigned"]),
+    AssetStatus.returned: Markup('<span class="text-blue-700">📦 %s</span>' % ASSET_STATUS_MAP["returned"]),
+    AssetStatus.lost: Markup('<span class="text-red-700">%s</span>' % ASSET_STATUS_MAP["lost"]),
+    AssetStatus.disposed: Markup('<span class="text-gray-700">%s</span>' % ASSET_STATUS_MAP["disposed"]),
 }
 
-MAINTENANCE_CATEGORY_MAP = {
-    "maintenance": "定期保養",
-    "repair": "維修",
-    "carwash": "一般洗車",
-    "deep_cleaning": "手工洗車",
-    "ritual_cleaning": "淨車",
-}
+format_vehicle_status_badge = _VEHICLE_STATUS_BADGE.get
+format_asset_status_badge = _ASSET_STATUS_BADGE.get
 
-INSPECTION_KIND_MAP = {
-    "periodic": "定期檢驗",
-    "emission": "排氣檢驗",
-    "reinspection": "複檢",
-}
-
-FEE_TYPE_MAP = {
-    "fuel_fee": "加油費",
-    "parking": "停車費",
-    "maintenance_service": "保養服務",
-    "repair_parts": "維修零件",
-    "inspection_fee": "檢驗費",
-    "supplies": "用品/雜項",
-    "toll": "E-Tag/過路費",
-    "license_tax": "稅金",
-    "other": "其他",
-}
-
-# 資產類型翻譯字典
-ASSET_TYPE_MAP = {
-    "key": "鑰匙",
-    "dashcam": "行車紀錄器",
-    "etag": "E-Tag",
-    "other": "其他",
-}
-
-# 資產狀態翻譯字典
-ASSET_STATUS_MAP = {
-    "assigned": "已指派",
-    "returned": "已歸還",
-    "lost": "遺失",
-    "disposed": "已報廢/處理",
-}
+# --- 附件連結 (同一個檔案重複顯示時直接取快取的 Markup) ---
+_EMPTY_MARKUP = Markup("")
 
-PARKING_STATUS_MAP = {
-    "empty": "空位",
-    "company_vehicle": "公司車",
-    "private_vehicle": "私車",
-}
-
-app = FastAPI(title="公務車管理系統")
-
-# --- DB 連線與 Session ---
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-Base.metadata.create_all(engine)
+_ATTACHMENT_LINK_HTML = (
+    '<a href="%s" target="_blank" '
+    'class="text-sm font-medium text-blue-600 hover:text-blue-800 truncate" '
+    'title="點擊開啟：%s">%s</a>'
+)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@lru_cache(maxsize=1024)
+def _attachment_link(file_path, file_name):
+    # 各自只跳脫一次，再套進固定的 % 樣板
+    file_name = escape(file_name)
+    return Markup(_ATTACHMENT_LINK_HTML % (escape(file_path), file_name, file_name))
+
+def format_attachment_link(file_path, file_name):
+    return _attachment_link(file_path, file_name) if file_path else _EMPTY_MARKUP
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 建立資料表只在伺服器啟動時做一次；單純 import app (工具腳本等) 不會連資料庫
+    if settings.AUTO_CREATE_SCHEMA:
+        Base.metadata.create_all(engine)
+    # 啟動時先把所有模板編譯進 Jinja 快取，第一個請求不必等編譯
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+    yield
+
+app = FastAPI(title="公務車管理系統", lifespan=lifespan)
+
+# --- 表單欄位型別 ---
+# 下拉選單的「-- 無 --」送出空字串：先轉成 None，其餘交給 pydantic 解析 UUID (格式錯誤回 422)
+def _empty_to_none(value):
+    return value or None
+
+OptionalUUIDForm = Annotated[Optional[UUID], BeforeValidator(_empty_to_none), Form()]
+
+def _is_unique_violation(e: IntegrityError, column):
+    """ 是否為指定欄位的唯一性衝突 (PostgreSQL 與 SQLite 的錯誤訊息都會帶出欄位名稱) """
+    message = str(e.orig)
+    return "unique" in message.lower() and column in message
+
+# --- 列表排序欄位 (載入時建好 欄位名稱 → 欄位 的對照表) ---
+# 排序參數只會對到真正的資料欄位，不會 getattr 到關聯或其他類別屬性
+def _sort_columns(model):
+    return MappingProxyType({attr.key: getattr(model, attr.key) for attr in sa_inspect(model).column_attrs})
+
+_VEHICLE_SORT_COLUMNS = _sort_columns(Vehicle)
+_MAINTENANCE_SORT_COLUMNS = _sort_columns(Maintenance)
+_INSPECTION_SORT_COLUMNS = _sort_columns(Inspection)
+_FEE_SORT_COLUMNS = _sort_columns(Fee)
+
+# --- 表單下拉選單快取 ---
+# 員工 / 車輛清單很少變動，表單每次開啟都整表排序查詢太浪費。
+# 只快取模板用得到的欄位 (Row，不是 ORM 物件，不會跨 session 延遲載入)；
+# 寫入端呼叫 _bump_options 讓版本號 +1，舊快取立即失效，另外以 TTL 涵蓋其他 worker 的寫入
+_OPTION_QUERIES = MappingProxyType({
+    "employees": select(Employee.id, Employee.name, Employee.phone, Employee.is_handler).order_by(Employee.name),
+    "vehicles": select(Vehicle.id, Vehicle.plate_no, Vehicle.model, Vehicle.user_id).order_by(Vehicle.plate_no),
+})
+_option_versions = dict.fromkeys(_OPTION_QUERIES, 0)
+_option_cache = {}  # 名稱 → (版本, 到期時間, rows)
+
+def _cached_options(db, name):
+    version = _option_versions[name]
+    entry = _option_cache.get(name)
+    if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+        return entry[2]
+    rows = tuple(db.execute(_OPTION_QUERIES[name]).all())
+    # 查詢期間若有寫入，版本號已變，存進去的這份下次就不會被使用
+    _option_cache[name] = (version, time.monotonic() + settings.OPTION_CACHE_TTL, rows)
+    return rows
+
+def _bump_options(*names):
+    for name in names:
+        _option_versions[name] += 1
+
+# --- 列表分頁 (keyset) ---
+def _keyset_page(db, stmt, model, sort_column, descending, after_id):
+    """ 依 (排序欄位, id) 做 keyset 分頁，回傳 (本頁資料, 下一頁游標 或 None) """
+    direction = desc if descending else asc
+    if after_id:
+        # 游標只帶上一頁最後一筆的 id，排序值用主鍵查回來，不必依欄位型別解析查詢參數
+        cursor_row = db.execute(select(sort_column).where(model.id == after_id)).first()
+        if cursor_row is None:
+            # 游標那筆已被刪除，無法判斷接續位置
+            raise HTTPException(status_code=404, detail="列表已變動，請重新整理")
+        last_value = cursor_row[0]
+        id_after = model.id < after_id if descending else model.id > after_id
+        if last_value is None:
+            # 已排到 NULL 區段 (NULL 一律排最後)
+            stmt = stmt.where(sort_column.is_(None), id_after)
+        else:
+            value_after = sort_column < last_value if descending else sort_column > last_value
+            stmt = stmt.where(or_(
+                value_after,
+                and_(sort_column == last_value, id_after),
+                sort_column.is_(None)
+            ))
+    # 多取一筆，用來判斷是否還有下一頁
+    page_size = settings.LIST_PAGE_SIZE
+    stmt = stmt.order_by(direction(sort_column).nulls_last(), direction(model.id)).limit(page_size + 1)
+    rows = db.scalars(stmt).all()
+    if len(rows) > page_size:
+        return rows[:page_size], rows[page_size - 1].id
+    return rows, None
+
+# --- 下拉選單選項 (enum 成員不會變動，載入時建好 tuple 給每個請求共用) ---
+_VEHICLE_TYPE_CHOICES = tuple(VehicleType)
+_VEHICLE_STATUS_CHOICES = tuple(VehicleStatus)
+_MAINTENANCE_CATEGORY_CHOICES = tuple(MaintenanceCategory)
+_INSPECTION_KIND_CHOICES = tuple(InspectionKind)
+_FEE_TYPE_CHOICES = tuple(FeeType)
+_ASSET_TYPE_CHOICES = tuple(AssetType)
+_ASSET_STATUS_CHOICES = tuple(AssetStatus)
+_PARKING_ASSIGNMENT_TYPE_CHOICES = tuple(ParkingAssignmentType)
 
 # --- 模板與靜態檔案 ---
 templates = Jinja2Templates(directory="templates")
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_PATH)), name="uploads")
+templates.env.auto_reload = settings.TEMPLATE_AUTO_RELOAD
+if settings.TEMPLATE_CACHE_DIR:
+    Path(settings.TEMPLATE_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+templates.env.bytecode_cache = FileSystemBytecodeCache(settings.TEMPLATE_CACHE_DIR)
+if settings.SERVE_UPLOADS:
+    # UPLOAD_PATH 已在 config.py 建立，不必再檢查目錄；附件不需要 html 模式
+    app.mount("/uploads", StaticFiles(directory=str(UPLOAD_PATH), check_dir=False, html=False), name="uploads")
 
 templates.env.globals['vehicle_type_map'] = VEHICLE_TYPE_MAP
 templates.env.globals['vehicle_status_map'] = VEHICLE_STATUS_MAP
@@ -133,16 +245,67 @@ templates.env.globals['asset_type_map'] = ASSET_TYPE_MAP
 templates.env.globals['asset_status_map'] = ASSET_STATUS_MAP
 templates.env.globals['parking_status_map'] = PARKING_STATUS_MAP
 
+# 所有模板過濾器集中在一張表，一次註冊
+TEMPLATE_FILTERS = MappingProxyType({
+    'format_vehicle_type': format_vehicle_type,
+    'format_vehicle_status': format_vehicle_status,
+    'format_maintenance_category': format_maintenance_category,
+    'format_inspection_kind': format_inspection_kind,
+    'format_fee_type': format_fee_type,
+    'format_asset_type': format_asset_type,
+    'format_asset_status': format_asset_status,
+    'format_parking_status': format_parking_status,
+    'format_vehicle_status_badge': format_vehicle_status_badge,
+    'format_asset_status_badge': format_asset_status_badge,
+    'format_attachment_link': format_attachment_link,
+})
+templates.env.filters.update(TEMPLATE_FILTERS)
+
+# --- HTMX 回應 ---
+# 各處傳進來的訊息與觸發事件都是固定字串，標頭只在第一次組好，之後重複使用唯讀的同一份
+@lru_cache(maxsize=None)
+def _saved_headers(message, htmx_trigger, close_modal):
+    toast_event = json.dumps({
+        "showToast": {
+            "message": message,
+            "level": "success",
+            "closeModal": close_modal
+        }
+    })
+    return MappingProxyType({
+        "HX-Trigger": htmx_trigger,
+        "HX-Trigger-After-Settle": toast_event
+    })
+
+def _saved_response(message, htmx_trigger, close_modal=True):
+    """ 儲存成功的共用回應：HX-Trigger 刷新列表，Settle 後再由前端顯示 Toast """
+    return Response(status_code=200, headers=_saved_headers(message, htmx_trigger, close_modal))
+
+def _etag_response(request, response):
+    """ 列表片段的條件式回應：以內容雜湊作 ETag，與 If-None-Match 相同時回 304，不再傳送整段 HTML """
+    etag = f'"{hashlib.blake2b(response.body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"} # no-cache：瀏覽器每次都帶 ETag 回來驗證
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
 # --- 頁面路由 ---
+# 不依賴 request 與資料庫的頁面外框，內容固定；
+# 關閉模板自動重新載入 (正式環境) 時只渲染一次，之後直接回傳同一份 HTML
+def _render_static(name):
+    return templates.get_template(name).render()
+
+if not settings.TEMPLATE_AUTO_RELOAD:
+    _render_static = lru_cache(maxsize=None)(_render_static)
+
 @app.get("/")
-async def get_main_page(request: Request):
-    return templates.TemplateResponse(
-        name="base.html",
-        context={"request": request}
-    )
+async def get_main_page():
+    return HTMLResponse(_render_static("base.html"))
 
 @app.get("/dashboard")
-async def get_dashboard(
+def get_dashboard(
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -164,10 +327,12 @@ async def get_dashboard(
         select(Vehicle)
         .where(Vehicle.status == VehicleStatus.active)
         .options(
-            joinedload(Vehicle.inspections), # 載入檢驗
-            joinedload(Vehicle.maintenance)  # 載入保養
+            # 兩個一對多集合若都用 joinedload，每台車會產生 檢驗數 × 保養數 列的笛卡兒積；
+            # selectinload 改為各自一次 IN 查詢
+            selectinload(Vehicle.inspections), # 載入檢驗
+            selectinload(Vehicle.maintenance)  # 載入保養
         )
-    ).unique().all()
+    ).all()
 
     # --- 核心邏輯 ---
     for vehicle in active_vehicles:
@@ -191,7 +356,7 @@ async def get_dashboard(
             status = ""
 
             # 規則 A：自用小客車 (car)
-            if vehicle.vehicle_type == VehicleType.car:
+            if vehicle.vehicle_type is VehicleType.car:
                 if vehicle_age_years < 5:
                     status = "車齡 < 5 年 (免驗)"
                 elif 5 <= vehicle_age_years < 10:
@@ -259,7 +424,7 @@ async def get_dashboard(
         last_maint = None
         if vehicle.maintenance:
             last_maint = max(
-                (m for m in vehicle.maintenance if m.performed_on and m.category == MaintenanceCategory.maintenance),
+                (m for m in vehicle.maintenance if m.performed_on and m.category is MaintenanceCategory.maintenance),
                 key=lambda m: m.performed_on,
                 default=None
             )
@@ -305,29 +470,29 @@ async def get_dashboard(
 
 # 新增「車輛管理」的主頁面路由
 @app.get("/vehicle-management")
-async def get_vehicle_management_page(
+def get_vehicle_management_page(
     request: Request, 
     db: Session = Depends(get_db)
 ):
     """
     渲染「車輛管理」的主頁面，包含篩選器。
     """
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
+    all_employees = _cached_options(db, "employees")
     
     return templates.TemplateResponse(
         name="pages/vehicle_management.html", # 我們將在步驟 3 建立這個新檔案
         context={
             "request": request,
             "all_employees": all_employees,
-            "all_vehicle_types": list(VehicleType),
-            "all_vehicle_statuses": list(VehicleStatus),
+            "all_vehicle_types": _VEHICLE_TYPE_CHOICES,
+            "all_vehicle_statuses": _VEHICLE_STATUS_CHOICES,
             "query_params": request.query_params # 傳遞查詢參數
         }
     )
 
 @app.get("/vehicle/new")
 @app.get("/vehicle/{vehicle_id}/edit")
-async def get_vehicle_form(
+def get_vehicle_form(
     request: Request, 
     vehicle_id: Optional[UUID] = None, 
     db: Session = Depends(get_db)
@@ -338,7 +503,7 @@ async def get_vehicle_form(
         if not vehicle:
             raise HTTPException(status_code=404, detail="Vehicle not found")
 
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
+    all_employees = _cached_options(db, "employees")
     
     # (!!!) 修正 5：從資料庫撈出所有不重複的公司名稱 (!!!)
     company_list_query = (
@@ -356,13 +521,13 @@ async def get_vehicle_form(
             "vehicle": vehicle, 
             "all_employees": all_employees,
             "all_companies": all_companies, # (!!!) 修正 6：傳遞到模板 (!!!)
-            "vehicle_types": list(VehicleType), 
-            "vehicle_statuses": list(VehicleStatus), 
+            "vehicle_types": _VEHICLE_TYPE_CHOICES, 
+            "vehicle_statuses": _VEHICLE_STATUS_CHOICES, 
         }
     )
 
 @app.get("/vehicle/{vehicle_id}")
-async def get_vehicle_detail_page(
+def get_vehicle_detail_page(
     request: Request, 
     vehicle_id: UUID, 
     db: Session = Depends(get_db)
@@ -391,9 +556,10 @@ async def get_vehicle_detail_page(
 
 # --- 列表 API (車輛) ---
 @app.get("/vehicles-list")
-async def get_vehicles_list(
+def get_vehicles_list(
     request: Request, 
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    after_id: Optional[UUID] = None
 ):
     """
     取得車輛列表 (片段)，支援篩選和排序。
@@ -403,7 +569,7 @@ async def get_vehicles_list(
     # 1. 建立基礎查詢
     stmt = (
         select(Vehicle)
-        .options(joinedload(Vehicle.user)) 
+        .options(joinedload(Vehicle.user), raiseload("*")) 
     )
     
     # 2. 處理篩選
@@ -422,35 +588,32 @@ async def get_vehicles_list(
     sort_by = query_params.get("sort_by", "plate_no") # 預設依車牌排序
     sort_order = query_params.get("sort_order", "asc") # 預設升冪
     
-    sort_column = getattr(Vehicle, sort_by, Vehicle.plate_no)
+    sort_column = _VEHICLE_SORT_COLUMNS.get(sort_by, Vehicle.plate_no)
     
-    if sort_order == "desc":
-        stmt = stmt.order_by(desc(sort_column))
-    else:
-        stmt = stmt.order_by(sort_column)
-
-    vehicles = db.scalars(stmt).all()
+    # 4. 分頁：帶 after_id 表示「載入更多」，只回傳接續的資料列 (格式錯誤由 FastAPI 回 422)
+    vehicles, next_cursor = _keyset_page(db, stmt, Vehicle, sort_column, sort_order == "desc", after_id)
     
-    return templates.TemplateResponse(
-        name="fragments/vehicle_list.html",
+    return _etag_response(request, templates.TemplateResponse(
+        name="fragments/vehicle_list_rows.html" if after_id else "fragments/vehicle_list.html",
         context={
             "request": request,
             "vehicles": vehicles,
+            "next_cursor": next_cursor,
             "query_params": query_params,
             "current_sort_by": sort_by,
             "current_sort_order": sort_order
         }
-    )
+    ))
 
 # --- 車輛 CRUD ---
 @app.post("/vehicle/new")
 @app.post("/vehicle/{vehicle_id}/edit")
-async def create_or_update_vehicle(
+def create_or_update_vehicle(
     request: Request,
     vehicle_id: Optional[UUID] = None, 
     db: Session = Depends(get_db),
     plate_no: str = Form(...),
-    user_id: Optional[str] = Form(None), 
+    user_id: OptionalUUIDForm = None,
     vehicle_type: VehicleType = Form(...),
     status: VehicleStatus = Form(...),
     company: Optional[str] = Form(None),
@@ -461,80 +624,67 @@ async def create_or_update_vehicle(
     manufacture_date: Optional[str] = Form(None),
     maintenance_interval: Optional[str] = Form(None) 
 ):
-    user_uuid = None
-    if user_id:
-        try:
-            user_uuid = UUID(user_id) 
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid User ID format")
+    # 更新欄位
+    values = dict(
+        plate_no=plate_no,
+        user_id=user_id,
+        vehicle_type=vehicle_type,
+        status=status,
+        company=company,
+        make=make,
+        model=model,
+        # (!!!) 2. 手動轉換 str (!!!)
+        manufacture_date=date.fromisoformat(manufacture_date) if manufacture_date else None,
+        maintenance_interval=int(maintenance_interval) if maintenance_interval else None
+    )
 
     if vehicle_id:
-        vehicle = db.get(Vehicle, vehicle_id)
-        if not vehicle:
-            raise HTTPException(status_code=404, detail="Vehicle not found")
+        # 編輯：直接 UPDATE ... RETURNING，一次往返同時得知車輛是否存在，不必先 db.get 載入
+        stmt = update(Vehicle).where(Vehicle.id == vehicle_id).values(**values).returning(Vehicle.id)
     else:
-        existing = db.scalar(select(Vehicle).where(Vehicle.plate_no == plate_no))
-        if existing:
-            raise HTTPException(status_code=400, detail="車牌號碼已存在")
-        vehicle = Vehicle()
-        db.add(vehicle)
-
-    # 更新欄位
-    vehicle.plate_no = plate_no
-    vehicle.user_id = user_uuid
-    vehicle.vehicle_type = vehicle_type
-    vehicle.status = status
-    vehicle.company = company
-    vehicle.make = make
-    vehicle.model = model
-    
-    # (!!!) 2. 手動轉換 str (!!!)
-    vehicle.manufacture_date = date.fromisoformat(manufacture_date) if manufacture_date else None
-    vehicle.maintenance_interval = int(maintenance_interval) if maintenance_interval else None
+        db.add(Vehicle(**values))
     
+    # 車牌重複交給資料庫的 UNIQUE 約束判斷：少一次事先查詢，也不會有兩個請求同時通過檢查的競態
     try:
+        if vehicle_id and db.scalar(stmt) is None:
+            db.rollback()
+            raise HTTPException(status_code=404, detail="Vehicle not found")
         db.commit()
+    except HTTPException:
+        raise
+    except IntegrityError as e:
+        db.rollback()
+        if _is_unique_violation(e, "plate_no"):
+            raise HTTPException(status_code=400, detail="車牌號碼已存在")
+        raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
     
-    toast_event = json.dumps({
-        "showToast": {
-            "message": "車輛儲存成功！", 
-            "level": "success",
-            "closeModal": True
-        }
-    })
-    htmx_trigger = "refreshVehicleList, refreshVehicleDetailPage"
-    
-    headers = {
-        "HX-Trigger": htmx_trigger,
-        "HX-Trigger-After-Settle": toast_event
-    }
-    return Response(status_code=200, headers=headers)
+    _bump_options("vehicles")
+    return _saved_response("車輛儲存成功！", "refreshVehicleList, refreshVehicleDetailPage")
 
 @app.delete("/vehicle/{vehicle_id}/delete")
-async def delete_vehicle(
+def delete_vehicle(
     vehicle_id: UUID,                 
     request: Request,
     db: Session = Depends(get_db)     
 ):
-    vehicle = db.get(Vehicle, vehicle_id)
-    if not vehicle:
-        return Response(status_code=200)
-
     try:
-        db.delete(vehicle)
+        # 保養/檢驗/費用/報廢/資產日誌 由資料庫的 ON DELETE CASCADE 一併刪除，
+        # 不必先載入整台車與各個集合再逐筆刪除；車輛已不存在時刪除 0 筆，同樣回傳成功
+        db.execute(delete(Vehicle).where(Vehicle.id == vehicle_id))
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=f"刪除失敗: {e}")
     
+    _bump_options("vehicles")
     return Response(status_code=200)
 
 # 「員工管理」的主頁面路由
 @app.get("/employee-management")
-async def get_employee_management_page(
+def get_employee_management_page(
     request: Request, 
     db: Session = Depends(get_db)
 ):
@@ -551,7 +701,7 @@ async def get_employee_management_page(
 
 # --- 列表 API (員工) ---
 @app.get("/employees-list")
-async def get_employees_list(
+def get_employees_list(
     request: Request, 
     db: Session = Depends(get_db)
 ):
@@ -586,19 +736,19 @@ async def get_employees_list(
     
     employees = db.scalars(stmt).all()
     
-    return templates.TemplateResponse(
+    return _etag_response(request, templates.TemplateResponse(
         name="fragments/employee_list.html",
         context={
             "request": request,
             "employees": employees,
             "query_params": query_params # 傳遞篩選參數
         }
-    )
+    ))
 
 # --- 員工 CRUD ---
 @app.get("/employee/new")
 @app.get("/employee/{employee_id}/edit")
-async def get_employee_form(
+def get_employee_form(
     request: Request,
     employee_id: Optional[UUID] = None,
     db: Session = Depends(get_db)
@@ -619,7 +769,7 @@ async def get_employee_form(
 
 @app.post("/employee/new")
 @app.post("/employee/{employee_id}/edit")
-async def create_or_update_employee(
+def create_or_update_employee(
     request: Request,
     employee_id: Optional[UUID] = None,
     db: Session = Depends(get_db),
@@ -634,9 +784,6 @@ async def create_or_update_employee(
         if not employee:
             raise HTTPException(status_code=404, detail="Employee not found")
     else:
-        existing = db.scalar(select(Employee).where(Employee.name == name))
-        if existing:
-            raise HTTPException(status_code=400, detail="員工姓名已存在")
         employee = Employee()
         db.add(employee)
 
@@ -647,30 +794,24 @@ async def create_or_update_employee(
     employee.has_motorcycle_license = has_motorcycle_license
     employee.is_handler = is_handler
     
+    # 姓名重複同樣由 UNIQUE 約束判斷
     try:
         db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if _is_unique_violation(e, "name"):
+            raise HTTPException(status_code=400, detail="員工姓名已存在")
+        raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
 
+    _bump_options("employees")
     # 觸發「員工」列表刷新
-    toast_event = json.dumps({
-        "showToast": {
-            "message": "員工儲存成功！", 
-            "level": "success",
-            "closeModal": True
-        }
-    })
-    htmx_trigger = "refreshEmployeeList"
-    
-    headers = {
-        "HX-Trigger": htmx_trigger,
-        "HX-Trigger-After-Settle": toast_event
-    }
-    return Response(status_code=200, headers=headers)
+    return _saved_response("員工儲存成功！", "refreshEmployeeList")
 
 @app.delete("/employee/{employee_id}/delete")
-async def delete_employee(
+def delete_employee(
     employee_id: UUID,
     request: Request,
     db: Session = Depends(get_db)
@@ -688,10 +829,11 @@ async def delete_employee(
             raise HTTPException(status_code=400, detail="無法刪除：此員工仍有關聯的車輛或紀錄。")
         raise HTTPException(status_code=500, detail=f"刪除失敗: {e}")
     
+    _bump_options("employees")
     return Response(status_code=200)
 
 @app.get("/vehicle/{vehicle_id}/maintenance-list")
-async def get_maintenance_list(
+def get_maintenance_list(
     request: Request,
     vehicle_id: UUID,
     db: Session = Depends(get_db)
@@ -701,8 +843,9 @@ async def get_maintenance_list(
         select(Maintenance)
         .where(Maintenance.vehicle_id == vehicle_id)
         .options(
-            joinedload(Maintenance.user), 
-            joinedload(Maintenance.handler)
+            selectinload(Maintenance.user), 
+            selectinload(Maintenance.handler),
+            raiseload("*")
         )
         .order_by(desc(Maintenance.performed_on)) # 依執行日期倒序
     )
@@ -718,9 +861,10 @@ async def get_maintenance_list(
     )
 
 @app.get("/maintenance-list-all")
-async def get_maintenance_list_all(
+def get_maintenance_list_all(
     request: Request,
-    db: Session = Depends(get_db) # (!!!) 修正 1：從 get.db 改為 get_db (!!!)
+    db: Session = Depends(get_db), # (!!!) 修正 1：從 get.db 改為 get_db (!!!)
+    after_id: Optional[UUID] = None
 ):
     """ 取得「所有」車輛的保養列表 (片段) - 支援篩選和排序 """
     
@@ -729,10 +873,14 @@ async def get_maintenance_list_all(
     # 1. (!!!) 建立基礎查詢 (!!!)
     stmt = (
         select(Maintenance)
+        # 多對一關聯改用 selectinload：不把車輛/員工欄位重複 JOIN 進每一列，
+        # 改為每個關聯一次 IN 查詢
         .options(
-            joinedload(Maintenance.user), 
-            joinedload(Maintenance.handler),
-            joinedload(Maintenance.vehicle)
+            selectinload(Maintenance.user), 
+            selectinload(Maintenance.handler),
+            selectinload(Maintenance.vehicle),
+            # 其餘關聯一律禁止延遲載入：模板若多存取未宣告的關聯會直接報錯，而不是每列偷偷多一次查詢
+            raiseload("*")
         )
     )
     
@@ -752,30 +900,29 @@ async def get_maintenance_list_all(
     sort_by = query_params.get("sort_by", "performed_on")
     sort_order = query_params.get("sort_order", "desc")
     
-    sort_column = getattr(Maintenance, sort_by, Maintenance.performed_on)
+    sort_column = _MAINTENANCE_SORT_COLUMNS.get(sort_by, Maintenance.performed_on)
     
-    if sort_order == "desc":
-        stmt = stmt.order_by(desc(sort_column))
-    else:
-        stmt = stmt.order_by(sort_column)
-
-    maintenance_records = db.scalars(stmt).all()
+    # 4. 分頁：帶 after_id 表示「載入更多」，只回傳接續的資料列 (格式錯誤由 FastAPI 回 422)
+    maintenance_records, next_cursor = _keyset_page(
+        db, stmt, Maintenance, sort_column, sort_order == "desc", after_id
+    )
 
-    # 4. (!!!) 傳回參數，供排序按鈕保持狀態 (!!!)
-    return templates.TemplateResponse(
-        name="fragments/maintenance_list_all.html",
+    # 5. (!!!) 傳回參數，供排序按鈕保持狀態 (!!!)
+    return _etag_response(request, templates.TemplateResponse(
+        name="fragments/maintenance_list_all_rows.html" if after_id else "fragments/maintenance_list_all.html",
         context={
             "request": request,
             "maintenance_records": maintenance_records,
+            "next_cursor": next_cursor,
             "query_params": query_params,
             "current_sort_by": sort_by,
             "current_sort_order": sort_order
         }
-    )
+    ))
 
 @app.get("/maintenance/new")
 @app.get("/maintenance/{maint_id}/edit")
-async def get_maintenance_form(
+def get_maintenance_form(
     request: Request,
     vehicle_id: Optional[UUID] = None,
     maint_id: Optional[UUID] = None,
@@ -786,7 +933,7 @@ async def get_maintenance_form(
     preselected_user_id: Optional[UUID] = None # (!!!) 1. 新增
     
     # (!!!) 2. 永遠載入 all_vehicles，修復舊 bug (!!!)
-    all_vehicles = db.scalars(select(Vehicle).order_by(Vehicle.plate_no)).all()
+    all_vehicles = _cached_options(db, "vehicles")
 
     if maint_id:
         # 編輯模式
@@ -797,14 +944,12 @@ async def get_maintenance_form(
     else:
         # (!!!) 3. 新增模式：如果 vehicle_id 存在，預先抓取 user_id (!!!)
         if vehicle_id:
-            vehicle = db.get(Vehicle, vehicle_id)
-            if vehicle:
-                preselected_user_id = vehicle.user_id
+            # 只需要使用人 ID，不必載入整台車
+            preselected_user_id = db.scalar(select(Vehicle.user_id).where(Vehicle.id == vehicle_id))
 
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
-    all_handlers = db.scalars(
-            select(Employee).where(Employee.is_handler == True).order_by(Employee.name)
-        ).all()
+    all_employees = _cached_options(db, "employees")
+    # 經手人是員工的子集合 (同樣依姓名排序)，直接從已載入的員工篩出，省一次查詢
+    all_handlers = [e for e in all_employees if e.is_handler]
 
     return templates.TemplateResponse(
         name="fragments/maintenance_form.html",
@@ -815,14 +960,14 @@ async def get_maintenance_form(
             "all_employees": all_employees,
             "all_handlers": all_handlers,
             "all_vehicles": all_vehicles, 
-            "maintenance_categories": list(MaintenanceCategory),
+            "maintenance_categories": _MAINTENANCE_CATEGORY_CHOICES,
             "preselected_user_id": preselected_user_id # (!!!) 4. 傳遞到模板 (!!!)
         }
     )
 
 # 保養管理主頁面
 @app.get("/maintenance-management")
-async def get_maintenance_page(
+def get_maintenance_page(
     request: Request,
     db: Session = Depends(get_db) # (!!!) 修正 2：從 get.db 改為 get_db (!!!)
 ):
@@ -830,8 +975,8 @@ async def get_maintenance_page(
     渲染「保養管理 (全列表)」的主頁面。
     傳遞篩選器所需的資料
     """
-    all_vehicles = db.scalars(select(Vehicle).order_by(Vehicle.plate_no)).all()
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
+    all_vehicles = _cached_options(db, "vehicles")
+    all_employees = _cached_options(db, "employees")
     
     return templates.TemplateResponse(
         name="pages/maintenance_management.html",
@@ -839,14 +984,14 @@ async def get_maintenance_page(
             "request": request,
             "all_vehicles": all_vehicles,
             "all_employees": all_employees,
-            "all_categories": list(MaintenanceCategory),
+            "all_categories": _MAINTENANCE_CATEGORY_CHOICES,
             "query_params": request.query_params # 傳遞空參數，供初始載入
         }
     )
 
 @app.post("/maintenance/new")
 @app.post("/maintenance/{maint_id}/edit")
-async def create_or_update_maintenance(
+def create_or_update_maintenance(
     request: Request,
     db: Session = Depends(get_db),
     maint_id: Optional[UUID] = None,
@@ -856,8 +1001,8 @@ async def create_or_update_maintenance(
     # (!!!) 1. 將 date, int, Decimal 改為 str (!!!)
     performed_on: Optional[str] = Form(None),
     return_date: Optional[str] = Form(None),
-    user_id: Optional[str] = Form(None),
-    handler_id: Optional[str] = Form(None),
+    user_id: OptionalUUIDForm = None,
+    handler_id: OptionalUUIDForm = None,
     vendor: Optional[str] = Form(None),
     odometer_km: Optional[str] = Form(None),
     service_target_km: Optional[str] = Form(None),
@@ -869,8 +1014,7 @@ async def create_or_update_maintenance(
 ):
     """ 處理保養紀錄的「新增」或「儲存」 """
 
-    user_uuid = UUID(user_id) if user_id else None
-    handler_uuid = UUID(handler_id) if handler_id else None
+    pending = [] # 新建的物件，最後一次 add_all 後在同一個 flush 內寫入
 
     if maint_id:
         maint = db.get(Maintenance, maint_id)
@@ -881,14 +1025,14 @@ async def create_or_update_maintenance(
             raise HTTPException(status_code=400, detail="必須選擇一輛車")
         maint = Maintenance()
         maint.vehicle_id = vehicle_id
-        db.add(maint)
+        pending.append(maint)
 
     # (!!!) 2. 手動轉換 str (!!!)
     maint.category = category
     maint.performed_on = date.fromisoformat(performed_on) if performed_on else None
     maint.return_date = date.fromisoformat(return_date) if return_date else None
-    maint.user_id = user_uuid
-    maint.handler_id = handler_uuid
+    maint.user_id = user_id
+    maint.handler_id = handler_id
     maint.vendor = vendor
     maint.odometer_km = int(odometer_km) if odometer_km else None
     maint.service_target_km = int(service_target_km) if service_target_km else None
@@ -901,10 +1045,10 @@ async def create_or_update_maintenance(
         # (!!!) 3. 檢查轉換後的 amount (!!!)
         if maint.amount and maint.amount > 0:
             fee_type = FeeType.maintenance_service
-            if category == MaintenanceCategory.repair:
+            if category is MaintenanceCategory.repair:
                 fee_type = FeeType.repair_parts
             
-            fee_user_id = handler_uuid if handler_uuid else user_uuid
+            fee_user_id = handler_id if handler_id else user_id
 
             new_fee = Fee(
                 vehicle_id=maint.vehicle_id,
@@ -914,32 +1058,20 @@ async def create_or_update_maintenance(
                 fee_type=fee_type,
                 amount=maint.amount, # <--
                 is_paid=is_reconciled, 
-                notes=f"自動建立 - {MAINTENANCE_CATEGORY_MAP.get(category.value, category.value)}: {notes or ''}"
+                notes=f"自動建立 - {format_maintenance_category(category)}: {notes or ''}"
             )
-            db.add(new_fee)
+            pending.append(new_fee)
 
+        db.add_all(pending)
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
 
-    toast_event = json.dumps({
-        "showToast": {
-            "message": "保養紀錄儲存成功！", 
-            "level": "success",
-            "closeModal": True
-        }
-    })
-    htmx_trigger = "refreshMaintenanceList, refreshMaintenanceListAll"
-    
-    headers = {
-        "HX-Trigger": htmx_trigger,
-        "HX-Trigger-After-Settle": toast_event
-    }
-    return Response(status_code=200, headers=headers)
+    return _saved_response("保養紀錄儲存成功！", "refreshMaintenanceList, refreshMaintenanceListAll")
 
 @app.delete("/maintenance/{maint_id}/delete")
-async def delete_maintenance(
+def delete_maintenance(
     maint_id: UUID,
     db: Session = Depends(get_db)
 ):
@@ -962,14 +1094,14 @@ async def delete_maintenance(
 
 # --- 檢驗紀錄 CRUD ---
 @app.get("/inspection-management")
-async def get_inspection_page(
+def get_inspection_page(
     request: Request,
     db: Session = Depends(get_db) # (!!!) 1. 加上 Depends(get_db) (!!!)
 ):
     """ 渲染「檢驗管理 (全列表)」的主頁面 """
     
     # (!!!) 2. 查詢篩選器所需的資料 (!!!)
-    all_vehicles = db.scalars(select(Vehicle).order_by(Vehicle.plate_no)).all()
+    all_vehicles = _cached_options(db, "vehicles")
     
     return templates.TemplateResponse(
         name="pages/inspection_management.html",
@@ -981,7 +1113,7 @@ async def get_inspection_page(
     )
 
 @app.get("/inspection-list-all")
-async def get_inspection_list_all(
+def get_inspection_list_all(
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -994,9 +1126,10 @@ async def get_inspection_list_all(
     stmt = (
         select(Inspection)
         .options(
-            joinedload(Inspection.user), 
-            joinedload(Inspection.handler),
-            joinedload(Inspection.vehicle)
+            selectinload(Inspection.user), 
+            selectinload(Inspection.handler),
+            selectinload(Inspection.vehicle),
+            raiseload("*")
         )
     )
 
@@ -1026,7 +1159,7 @@ async def get_inspection_list_all(
     sort_by = query_params.get("sort_by", "inspected_on") # 預設依「實際驗車日」
     sort_order = query_params.get("sort_order", "desc")  # 預設倒序
     
-    sort_column = getattr(Inspection, sort_by, Inspection.inspected_on)
+    sort_column = _INSPECTION_SORT_COLUMNS.get(sort_by, Inspection.inspected_on)
     
     if sort_order == "desc":
         stmt = stmt.order_by(desc(sort_column))
@@ -1036,7 +1169,7 @@ async def get_inspection_list_all(
     # (!!!) 5. 執行查詢 (!!!)
     inspection_records = db.scalars(stmt).all()
 
-    return templates.TemplateResponse(
+    return _etag_response(request, templates.TemplateResponse(
         name="fragments/inspection_list_all.html",
         context={
             "request": request,
@@ -1046,10 +1179,10 @@ async def get_inspection_list_all(
             "current_sort_by": sort_by,
             "current_sort_order": sort_order
         }
-    )
+    ))
 
 @app.get("/vehicle/{vehicle_id}/inspection-list")
-async def get_inspection_list(
+def get_inspection_list(
     request: Request,
     vehicle_id: UUID,
     db: Session = Depends(get_db)
@@ -1059,8 +1192,9 @@ async def get_inspection_list(
         select(Inspection)
         .where(Inspection.vehicle_id == vehicle_id)
         .options(
-            joinedload(Inspection.user), 
-            joinedload(Inspection.handler)
+            selectinload(Inspection.user), 
+            selectinload(Inspection.handler),
+            raiseload("*")
         )
         .order_by(desc(Inspection.inspected_on), desc(Inspection.notification_date))
     )
@@ -1077,7 +1211,7 @@ async def get_inspection_list(
 
 @app.get("/inspection/new")
 @app.get("/inspection/{insp_id}/edit")
-async def get_inspection_form(
+def get_inspection_form(
     request: Request,
     vehicle_id: Optional[UUID] = None,
     insp_id: Optional[UUID] = None,
@@ -1088,7 +1222,7 @@ async def get_inspection_form(
     preselected_user_id: Optional[UUID] = None # (!!!) 1. 新增
     
     # (!!!) 2. 永遠載入 all_vehicles (!!!)
-    all_vehicles = db.scalars(select(Vehicle).order_by(Vehicle.plate_no)).all()
+    all_vehicles = _cached_options(db, "vehicles")
 
     if insp_id:
         # 編輯模式
@@ -1099,14 +1233,11 @@ async def get_inspection_form(
     else:
         # (!!!) 3. 新增模式：如果 vehicle_id 存在，預先抓取 user_id (!!!)
         if vehicle_id:
-            vehicle = db.get(Vehicle, vehicle_id)
-            if vehicle:
-                preselected_user_id = vehicle.user_id
+            # 只需要使用人 ID，不必載入整台車
+            preselected_user_id = db.scalar(select(Vehicle.user_id).where(Vehicle.id == vehicle_id))
 
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
-    all_handlers = db.scalars(
-            select(Employee).where(Employee.is_handler == True).order_by(Employee.name)
-        ).all()
+    all_employees = _cached_options(db, "employees")
+    all_handlers = [e for e in all_employees if e.is_handler]
 
     return templates.TemplateResponse(
         name="fragments/inspection_form.html",
@@ -1117,14 +1248,14 @@ async def get_inspection_form(
             "all_employees": all_employees,
             "all_handlers": all_handlers,
             "all_vehicles": all_vehicles,
-            "inspection_kinds": list(InspectionKind),
+            "inspection_kinds": _INSPECTION_KIND_CHOICES,
             "preselected_user_id": preselected_user_id # (!!!) 4. 傳遞到模板 (!!!)
         }
     )
 
 @app.post("/inspection/new")
 @app.post("/inspection/{insp_id}/edit")
-async def create_or_update_inspection(
+def create_or_update_inspection(
     request: Request,
     db: Session = Depends(get_db),
     insp_id: Optional[UUID] = None,
@@ -1138,8 +1269,8 @@ async def create_or_update_inspection(
     return_date: Optional[str] = Form(None),
     next_due_on: Optional[str] = Form(None),
     
-    user_id: Optional[str] = Form(None),
-    handler_id: Optional[str] = Form(None),
+    user_id: OptionalUUIDForm = None,
+    handler_id: OptionalUUIDForm = None,
     
     # (!!!) 2. 將 Decimal 也改為 str (!!!)
     amount: Optional[str] = Form(None),
@@ -1152,8 +1283,7 @@ async def create_or_update_inspection(
 ):
     """ 處理檢驗紀錄的「新增」或「儲存」 """
 
-    user_uuid = UUID(user_id) if user_id else None
-    handler_uuid = UUID(handler_id) if handler_id else None
+    pending = [] # 同保養紀錄：新建的物件最後一次 add_all
 
     if insp_id:
         insp = db.get(Inspection, insp_id)
@@ -1164,7 +1294,7 @@ async def create_or_update_inspection(
              raise HTTPException(status_code=400, detail="必須選擇一輛車")
         insp = Inspection()
         insp.vehicle_id = vehicle_id
-        db.add(insp)
+        pending.append(insp)
 
     # (!!!) 3. 手動轉換所有 str (!!!)
     insp.kind = kind
@@ -1173,8 +1303,8 @@ async def create_or_update_inspection(
     insp.inspected_on = date.fromisoformat(inspected_on) if inspected_on else None
     insp.return_date = date.fromisoformat(return_date) if return_date else None
     insp.next_due_on = date.fromisoformat(next_due_on) if next_due_on else None
-    insp.user_id = user_uuid
-    insp.handler_id = handler_uuid
+    insp.user_id = user_id
+    insp.handler_id = handler_id
     insp.amount = Decimal(amount) if amount else None # <-- 轉換 Decimal
     insp.is_reconciled = is_reconciled
     insp.result = result
@@ -1185,7 +1315,7 @@ async def create_or_update_inspection(
     try:
         # (!!!) 4. 檢查轉換後的 amount (!!!)
         if insp.amount and insp.amount > 0:
-            fee_user_id = handler_uuid if handler_uuid else user_uuid
+            fee_user_id = handler_id if handler_id else user_id
             
             # (!!!) 5. 確保日期變數是轉換後的 (!!!)
             receive_date_obj = insp.inspected_on or insp.notification_date
@@ -1198,32 +1328,20 @@ async def create_or_update_inspection(
                 fee_type=FeeType.inspection_fee,
                 amount=insp.amount, # <--
                 is_paid=is_reconciled,
-                notes=f"自動建立 - 檢驗費: {INSPECTION_KIND_MAP.get(kind.value, kind.value)}"
+                notes=f"自動建立 - 檢驗費: {format_inspection_kind(kind)}"
             )
-            db.add(new_fee)
+            pending.append(new_fee)
 
+        db.add_all(pending)
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
 
-    toast_event = json.dumps({
-        "showToast": {
-            "message": "檢驗紀錄儲存成功！", 
-            "level": "success",
-            "closeModal": True
-        }
-    })
-    htmx_trigger = "refreshInspectionList, refreshInspectionListAll"
-    
-    headers = {
-        "HX-Trigger": htmx_trigger,
-        "HX-Trigger-After-Settle": toast_event
-    }
-    return Response(status_code=200, headers=headers)
+    return _saved_response("檢驗紀錄儲存成功！", "refreshInspectionList, refreshInspectionListAll")
 
 @app.delete("/inspection/{insp_id}/delete")
-async def delete_inspection(
+def delete_inspection(
     insp_id: UUID,
     db: Session = Depends(get_db)
 ):
@@ -1246,15 +1364,15 @@ async def delete_inspection(
 
 # --- 費用紀錄 CRUD ---
 @app.get("/fee-management")
-async def get_fee_page(
+def get_fee_page(
     request: Request,
     db: Session = Depends(get_db) # (!!!) 修正 1：加入 db 依賴 (!!!)
 ):
     """ 渲染「費用管理 (全列表)」的主頁面 """
     
     # (!!!) 修正 2：查詢篩選器所需的資料 (!!!)
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
-    all_fee_types = list(FeeType)
+    all_employees = _cached_options(db, "employees")
+    all_fee_types = _FEE_TYPE_CHOICES
     
     return templates.TemplateResponse(
         name="pages/fee_management.html",
@@ -1268,7 +1386,7 @@ async def get_fee_page(
     )
 
 @app.get("/fee-list-all")
-async def get_fee_list_all(
+def get_fee_list_all(
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -1279,8 +1397,9 @@ async def get_fee_list_all(
     stmt = (
         select(Fee)
         .options(
-            joinedload(Fee.user), # 請款人
-            joinedload(Fee.vehicle) # 關聯車輛
+            selectinload(Fee.user), # 請款人
+            selectinload(Fee.vehicle), # 關聯車輛
+            raiseload("*")
         )
     )
     
@@ -1313,7 +1432,7 @@ async def get_fee_list_all(
         sort_column = Vehicle.plate_no
         stmt = stmt.join(Fee.vehicle, isouter=True)
     else:
-        sort_column = getattr(Fee, sort_by, Fee.receive_date) # 安全的 attribute 存取
+        sort_column = _FEE_SORT_COLUMNS.get(sort_by, Fee.receive_date)
 
     if sort_order == "desc":
         stmt = stmt.order_by(desc(sort_column))
@@ -1327,7 +1446,7 @@ async def get_fee_list_all(
 
     fee_records = db.scalars(stmt).all()
 
-    return templates.TemplateResponse(
+    return _etag_response(request, templates.TemplateResponse(
         name="fragments/fee_list_all.html",
         context={
             "request": request,
@@ -1337,10 +1456,10 @@ async def get_fee_list_all(
             "current_sort_by": sort_by,
             "current_sort_order": sort_order
         }
-    )
+    ))
 
 @app.get("/vehicle/{vehicle_id}/fee-list")
-async def get_fee_list(
+def get_fee_list(
     request: Request,
     vehicle_id: UUID,
     db: Session = Depends(get_db)
@@ -1350,7 +1469,8 @@ async def get_fee_list(
         select(Fee)
         .where(Fee.vehicle_id == vehicle_id)
         .options(
-            joinedload(Fee.user) # 請款人
+            joinedload(Fee.user), # 請款人
+            raiseload("*")
         )
         .order_by(desc(Fee.receive_date), desc(Fee.request_date))
     )
@@ -1367,7 +1487,7 @@ async def get_fee_list(
 
 @app.get("/fee/new")
 @app.get("/fee/{fee_id}/edit")
-async def get_fee_form(
+def get_fee_form(
     request: Request,
     vehicle_id: Optional[UUID] = None, # 來自車輛詳情頁
     fee_id: Optional[UUID] = None,
@@ -1386,13 +1506,12 @@ async def get_fee_form(
     else:
         # (!!!) 2. 新增模式：如果 vehicle_id 存在，預先抓取 user_id (!!!)
         if vehicle_id:
-            vehicle = db.get(Vehicle, vehicle_id)
-            if vehicle:
-                preselected_user_id = vehicle.user_id
+            # 只需要使用人 ID，不必載入整台車
+            preselected_user_id = db.scalar(select(Vehicle.user_id).where(Vehicle.id == vehicle_id))
 
     # 費用表單「永遠」需要所有車輛和員工
-    all_vehicles = db.scalars(select(Vehicle).order_by(Vehicle.plate_no)).all()
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
+    all_vehicles = _cached_options(db, "vehicles")
+    all_employees = _cached_options(db, "employees")
 
     return templates.TemplateResponse(
         name="fragments/fee_form.html",
@@ -1402,19 +1521,19 @@ async def get_fee_form(
             "selected_vehicle_id": vehicle_id, 
             "all_employees": all_employees,
             "all_vehicles": all_vehicles,
-            "fee_types": list(FeeType),
+            "fee_types": _FEE_TYPE_CHOICES,
             "preselected_user_id": preselected_user_id # (!!!) 3. 傳遞到模板 (!!!)
         }
     )
 
 @app.post("/fee/new")
 @app.post("/fee/{fee_id}/edit")
-async def create_or_update_fee(
+def create_or_update_fee(
     request: Request,
     db: Session = Depends(get_db),
     fee_id: Optional[UUID] = None,
-    vehicle_id: Optional[str] = Form(None), 
-    user_id: Optional[str] = Form(None), 
+    vehicle_id: OptionalUUIDForm = None,
+    user_id: OptionalUUIDForm = None,
 
     fee_type: FeeType = Form(...),
     
@@ -1432,8 +1551,6 @@ async def create_or_update_fee(
 ):
     """ 處理費用紀錄的「新增」或「儲存」 """
 
-    vehicle_uuid = UUID(vehicle_id) if vehicle_id else None
-    user_uuid = UUID(user_id) if user_id else None
 
     if fee_id:
         fee = db.get(Fee, fee_id)
@@ -1443,8 +1560,8 @@ async def create_or_update_fee(
         fee = Fee()
         db.add(fee)
 
-    fee.vehicle_id = vehicle_uuid
-    fee.user_id = user_uuid
+    fee.vehicle_id = vehicle_id
+    fee.user_id = user_id
     fee.fee_type = fee_type
     fee.amount = Decimal(amount) if amount else None
     fee.receive_date = date.fromisoformat(receive_date) if receive_date else None
@@ -1465,23 +1582,10 @@ async def create_or_update_fee(
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
 
     # 觸發列表刷新
-    toast_event = json.dumps({
-        "showToast": {
-            "message": "費用儲存成功！", 
-            "level": "success",
-            "closeModal": True
-        }
-    })
-    htmx_trigger = "refreshFeeList, refreshFeeListAll"
-    
-    headers = {
-        "HX-Trigger": htmx_trigger,
-        "HX-Trigger-After-Settle": toast_event
-    }
-    return Response(status_code=200, headers=headers)
+    return _saved_response("費用儲存成功！", "refreshFeeList, refreshFeeListAll")
 
 @app.delete("/fee/{fee_id}/delete")
-async def delete_fee(
+def delete_fee(
     fee_id: UUID,
     db: Session = Depends(get_db)
 ):
@@ -1503,7 +1607,7 @@ async def delete_fee(
     )
 
 @app.get("/vehicle/{vehicle_id}/asset-log-list")
-async def get_asset_log_list(
+def get_asset_log_list(
     request: Request,
     vehicle_id: UUID,
     db: Session = Depends(get_db)
@@ -1513,7 +1617,7 @@ async def get_asset_log_list(
     stmt = (
         select(VehicleAssetLog)
         .where(VehicleAssetLog.vehicle_id == vehicle_id)
-        .options(joinedload(VehicleAssetLog.user))
+        .options(joinedload(VehicleAssetLog.user), raiseload("*"))
         .order_by(desc(VehicleAssetLog.log_date)) # 依日期倒序
     )
     asset_logs = db.scalars(stmt).all()
@@ -1555,7 +1659,7 @@ async def get_asset_log_list(
 
 @app.get("/asset-log/new")
 @app.get("/asset-log/{log_id}/edit")
-async def get_asset_log_form(
+def get_asset_log_form(
     request: Request,
     vehicle_id: Optional[UUID] = None, # 來自車輛詳情頁
     log_id: Optional[UUID] = None,
@@ -1569,7 +1673,7 @@ async def get_asset_log_form(
             raise HTTPException(status_code=404, detail="Asset log not found")
         vehicle_id = log.vehicle_id # 編輯時鎖定 vehicle_id
 
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
+    all_employees = _cached_options(db, "employees")
 
     return templates.TemplateResponse(
         name="fragments/asset_log_form.html",
@@ -1578,19 +1682,19 @@ async def get_asset_log_form(
             "log": log,
             "vehicle_id": vehicle_id, # 必須傳入，用於 POST
             "all_employees": all_employees,
-            "asset_types": list(AssetType),
-            "asset_statuses": list(AssetStatus),
+            "asset_types": _ASSET_TYPE_CHOICES,
+            "asset_statuses": _ASSET_STATUS_CHOICES,
         }
     )
 
 @app.post("/asset-log/new")
 @app.post("/asset-log/{log_id}/edit")
-async def create_or_update_asset_log(
+def create_or_update_asset_log(
     request: Request,
     db: Session = Depends(get_db),
     log_id: Optional[UUID] = None,
     vehicle_id: UUID = Form(...), # 隱藏欄位
-    user_id: Optional[str] = Form(None),
+    user_id: OptionalUUIDForm = None,
     asset_type: AssetType = Form(...),
     description: Optional[str] = Form(None),
     status: AssetStatus = Form(...),
@@ -1602,8 +1706,6 @@ async def create_or_update_asset_log(
 ):
     """ 處理資產日誌的「新增」或「儲存」 """
 
-    user_uuid = UUID(user_id) if user_id else None
-
     if log_id:
         log = db.get(VehicleAssetLog, log_id)
         if not log:
@@ -1614,7 +1716,7 @@ async def create_or_update_asset_log(
         db.add(log)
 
     # (!!!) 2. 手動轉換 str (!!!)
-    log.user_id = user_uuid
+    log.user_id = user_id
     log.asset_type = asset_type
     log.description = description
     log.status = status
@@ -1627,23 +1729,10 @@ async def create_or_update_asset_log(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
 
-    toast_event = json.dumps({
-        "showToast": {
-            "message": "資產日誌儲存成功！", 
-            "level": "success",
-            "closeModal": True
-        }
-    })
-    htmx_trigger = "refreshAssetLogList"
-    
-    headers = {
-        "HX-Trigger": htmx_trigger,
-        "HX-Trigger-After-Settle": toast_event
-    }
-    return Response(status_code=200, headers=headers)
+    return _saved_response("資產日誌儲存成功！", "refreshAssetLogList")
 
 @app.delete("/asset-log/{log_id}/delete")
-async def delete_asset_log(
+def delete_asset_log(
     log_id: UUID,
     db: Session = Depends(get_db)
 ):
@@ -1665,7 +1754,7 @@ async def delete_asset_log(
 # 做列表，而是直接做「Get/Create/Update/Delete」
 
 @app.get("/vehicle/{vehicle_id}/disposal-form")
-async def get_disposal_form(
+def get_disposal_form(
     request: Request,
     vehicle_id: UUID,
     db: Session = Depends(get_db)
@@ -1675,7 +1764,7 @@ async def get_disposal_form(
     stmt = select(Disposal).where(Disposal.vehicle_id == vehicle_id)
     disposal = db.scalar(stmt)
 
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
+    all_employees = _cached_options(db, "employees")
 
     return templates.TemplateResponse(
         name="fragments/disposal_form.html",
@@ -1688,12 +1777,12 @@ async def get_disposal_form(
     )
 
 @app.post("/vehicle/{vehicle_id}/disposal-form")
-async def create_or_update_disposal(
+def create_or_update_disposal(
     request: Request,
     vehicle_id: UUID,
     db: Session = Depends(get_db),
     # --- 接收表單欄位 ---
-    user_id: Optional[str] = Form(None), # 原使用人
+    user_id: OptionalUUIDForm = None, # 原使用人
     
     # (!!!) 1. 將 date 和 int 改為 str (!!!)
     disposed_on: str = Form(...), # (必填)
@@ -1717,7 +1806,7 @@ async def create_or_update_disposal(
         db.add(disposal)
 
     # (!!!) 2. 手動轉換 str (!!!)
-    disposal.user_id = UUID(user_id) if user_id else None
+    disposal.user_id = user_id
     disposal.disposed_on = date.fromisoformat(disposed_on) if disposed_on else None
     disposal.notification_date = date.fromisoformat(notification_date) if notification_date else None
     disposal.final_mileage = int(final_mileage) if final_mileage else None
@@ -1740,7 +1829,7 @@ async def create_or_update_disposal(
     )
 
 @app.delete("/disposal/{disp_id}/delete")
-async def delete_disposal(
+def delete_disposal(
     disp_id: UUID,
     db: Session = Depends(get_db)
 ):
@@ -1772,7 +1861,7 @@ async def delete_disposal(
 
 # --- 附件管理 CRUD ---
 @app.get("/attachments/manage/{entity_type}/{entity_id}")
-async def get_attachments_manager(
+def get_attachments_manager(
     request: Request,
     entity_type: AttachmentEntity,
     entity_id: UUID,
@@ -1801,113 +1890,137 @@ async def get_attachments_manager(
         }
     )
 
+# 上傳檔案以固定大小分塊寫入，記憶體用量不隨檔案大小增加
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def _write_upload(src, dest_path):
+    with dest_path.open("wb") as buffer:
+        shutil.copyfileobj(src, buffer, UPLOAD_CHUNK_SIZE)
+
+def _write_content_addressed(src, ext):
+    """ 邊寫入邊計算 blake2b，以內容雜湊命名；相同內容的檔案只保留一份 """
+    digest = hashlib.blake2b(digest_size=16)
+    tmp_path = UPLOAD_PATH / f".upload-{uuid4().hex}.tmp"
+    try:
+        with tmp_path.open("wb") as buffer:
+            while chunk := src.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                buffer.write(chunk)
+            # 先確定內容落盤再改名，當機時不會留下寫到一半、卻已被資料庫引用的檔案
+            buffer.flush()
+            os.fsync(buffer.fileno())
+        safe_filename = f"{digest.hexdigest()}{ext}"
+        file_path = UPLOAD_PATH / safe_filename
+        try:
+            # 已經有一模一樣的檔案：直接共用，不再多存一份；
+            # 同時更新 mtime，刪檔前的寬限時間從現在起算
+            os.utime(file_path)
+        except FileNotFoundError:
+            os.replace(tmp_path, file_path)
+        else:
+            tmp_path.unlink()
+        return file_path, safe_filename
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def _store_attachment_file(file: UploadFile):
+    """ 把上傳檔案存進 UPLOAD_PATH，回傳 (實體路徑, 存檔名稱) """
+    # 檔名格式: [內容雜湊].[extension]
+    ext = os.path.splitext(file.filename)[1]
+
+    # 儲存實體檔案 (分塊寫入；上傳路由是 def，整段在 threadpool 中執行)
+    try:
+        return _write_content_addressed(file.file, ext)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"無法儲存檔案: {e}")
+    finally:
+        file.file.close()
+
+# 內容雜湊命名的上傳檔：32 碼十六進位 blake2b + 原副檔名
+CONTENT_ADDRESSED_NAME = re.compile(r"[0-9a-f]{32}(\.[^.]*)?")
+# 多筆附件 (含其他請求正在上傳、尚未 commit 的) 可能共用同一個檔案；
+# 共用時會更新 mtime，超過寬限時間沒被動過的檔案才可能刪除
+UPLOAD_ORPHAN_GRACE_SECONDS = 60 * 60
+
+def remove_unreferenced_upload(db: Session, file_name: str):
+    """ 內容雜湊命名、沒有附件紀錄引用且超過寬限時間的上傳檔才刪除，回傳是否已刪除 """
+    if not CONTENT_ADDRESSED_NAME.fullmatch(file_name):
+        return False
+    stmt = select(Attachment.id).where(Attachment.file_path == f"/uploads/{file_name}").limit(1)
+    if db.scalar(stmt) is not None:
+        return False
+    file_path = UPLOAD_PATH / file_name
+    try:
+        if file_path.stat().st_mtime > time.time() - UPLOAD_ORPHAN_GRACE_SECONDS:
+            return False
+        file_path.unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
 @app.post("/attachment/upload")
-async def upload_attachment(
+def upload_attachment(
     request: Request,
     db: Session = Depends(get_db),
     
-    # (!!!) 1. 將型別改為 str (!!!)
-    entity_type: str = Form(...),
-    entity_id: str = Form(...),
+    entity_type: AttachmentEntity = Form(...),
+    entity_id: UUID = Form(...),
     
     description: Optional[str] = Form(None),
     file: UploadFile = File(...)
 ):
-    """ 處理檔案上傳 """
+    """ 單檔上傳：與多檔上傳共用同一段處理流程 """
+    return upload_attachments_bulk(request, db, entity_type, entity_id, description, [file])
 
-    if not file:
-        raise HTTPException(status_code=400, detail="沒有提供檔案")
-
-    # (!!!) 2. 手動驗證和轉換 (!!!)
-    try:
-        entity_type_enum = AttachmentEntity(entity_type)
-    except ValueError:
-        raise HTTPException(status_code=400, detail=f"無效的 entity_type: {entity_type}")
-
-    try:
-        entity_id_uuid = UUID(entity_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail=f"無效的 entity_id 格式: {entity_id}")
-    
-    # (!!!) 3. 處理空字串 (!!!)
+@app.post("/attachment/upload-bulk")
+def upload_attachments_bulk(
+    request: Request,
+    db: Session = Depends(get_db),
+    entity_type: AttachmentEntity = Form(...),
+    entity_id: UUID = Form(...),
+    description: Optional[str] = Form(None),
+    files: list[UploadFile] = File(...)
+):
+    """ 一次上傳多個檔案：全部存檔後只做一次 commit """
     description_to_save = description if description else None
 
-    # 產生一個安全的檔案名稱
-    # 格式: [entity_id]_[uuid].[extension]
-    ext = Path(file.filename).suffix
-    safe_filename = f"{entity_id_uuid}_{uuid4()}{ext}" # (使用 uuid 物件)
-    file_path = UPLOAD_PATH / safe_filename
-
-    # 儲存實體檔案
-    try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"無法儲存檔案: {e}")
-    finally:
-        file.file.close()
-
-    # 建立資料庫紀錄
-    new_attachment = Attachment(
-        # (!!!) 4. 使用轉換後的值 (!!!)
-        entity_type=entity_type_enum,
-        entity_id=entity_id_uuid,
-        file_name=file.filename, 
-        file_path=f"/uploads/{safe_filename}", 
-        description=description_to_save
-    )
-    db.add(new_attachment)
+    # 其中一個檔案存檔失敗時直接回錯誤；已存好的檔案交給 sweep_uploads.py 清理
+    saved = []  # [(存檔名稱, 原始檔名)]
+    for file in files:
+        _, safe_filename = _store_attachment_file(file)
+        saved.append((safe_filename, file.filename))
+
+    db.add_all([
+        Attachment(
+            entity_type=entity_type,
+            entity_id=entity_id,
+            file_name=file_name,
+            file_path=f"/uploads/{safe_filename}",
+            description=description_to_save
+        )
+        for safe_filename, file_name in saved
+    ])
 
     try:
         db.commit()
     except Exception as e:
         db.rollback()
-        if file_path.exists():
-            file_path.unlink()
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
 
-    toast_event = json.dumps({
-        "showToast": {
-            "message": "附件上傳成功！", 
-            "level": "success",
-            "closeModal": False
-        }
-    })
-    htmx_trigger = "refreshAttachmentsList"
-    
-    headers = {
-        "HX-Trigger": htmx_trigger,
-        "HX-Trigger-After-Settle": toast_event
-    }
-    return Response(status_code=200, headers=headers)
+    return _saved_response("附件上傳成功！", "refreshAttachmentsList", close_modal=False)
 
 @app.delete("/attachment/{attachment_id}/delete")
-async def delete_attachment(
+def delete_attachment(
     attachment_id: UUID,
     db: Session = Depends(get_db)
 ):
-    """ 刪除一筆附件 (包含實體檔案) """
+    """ 刪除一筆附件 (實體檔案沒有其他附件共用時一併刪除) """
 
     att = db.get(Attachment, attachment_id)
     if not att:
         return Response(status_code=200) # 已被刪除
 
-    # 1. 刪除實體檔案
-    try:
-        # 從 /uploads/filename.ext 取得 filename.ext
-        file_name_on_disk = Path(att.file_path).name
-        file_path = UPLOAD_PATH / file_name_on_disk
-
-        if file_path.exists():
-            file_path.unlink()
-        else:
-            print(f"警告：找不到要刪除的檔案 {file_path}")
-
-    except Exception as e:
-        print(f"刪除實體檔案失敗: {e}")
-        # 注意：我們不中斷，即使檔案刪除失敗，還是要刪除資料庫紀錄
-
-    # 2. 刪除資料庫紀錄
     try:
         db.delete(att)
         db.commit()
@@ -1915,6 +2028,13 @@ async def delete_attachment(
         db.rollback()
         raise HTTPException(status_code=400, detail=f"刪除資料庫紀錄失敗: {e}")
 
+    # 紀錄刪除後才刪實體檔案：仍有其他附件引用、或剛被上傳共用的檔案會保留
+    try:
+        remove_unreferenced_upload(db, Path(att.file_path).name)
+    except Exception as e:
+        print(f"刪除實體檔案失敗: {e}")
+        # 注意：資料庫紀錄已經刪除，檔案留待 sweep_uploads.py 清理
+
     # 觸發附件列表刷新
     return Response(
         status_code=200,
@@ -1922,7 +2042,7 @@ async def delete_attachment(
     )
 
 @app.get("/fragments/user-options")
-async def get_user_options(
+def get_user_options(
     request: Request,
     vehicle_id: Optional[UUID] = None, # 來自 hx-include
     db: Session = Depends(get_db)
@@ -1934,14 +2054,11 @@ async def get_user_options(
     
     # 1. 檢查 vehicle_id 是否有效
     if vehicle_id:
-        # 2. 查詢該車輛
-        vehicle = db.get(Vehicle, vehicle_id)
-        if vehicle:
-            # 3. 取得該車輛的主要使用人 ID
-            preselected_user_id = vehicle.user_id
+        # 2. 查詢該車輛的主要使用人 ID (只取這一欄，不必載入整台車)
+        preselected_user_id = db.scalar(select(Vehicle.user_id).where(Vehicle.id == vehicle_id))
     
     # 4. 取得所有員工
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
+    all_employees = _cached_options(db, "employees")
     
     # 5. 渲染「只有選項」的模板
     return templates.TemplateResponse(
@@ -1954,7 +2071,7 @@ async def get_user_options(
     )
 
 @app.get("/fragments/vehicle-options")
-async def get_vehicle_options(
+def get_vehicle_options(
     request: Request,
     user_id: Optional[UUID] = None, # 來自 hx-include
     # (!!!) 1. 我們新增一個參數來控制「-- 無 --」選項
@@ -1965,7 +2082,7 @@ async def get_vehicle_options(
     根據傳入的 user_id，回傳預選了主要車輛的 <option> 列表
     """
     preselected_vehicle_id: Optional[UUID] = None
-    all_vehicles = db.scalars(select(Vehicle).order_by(Vehicle.plate_no)).all()
+    all_vehicles = _cached_options(db, "vehicles")
 
     # 1. 檢查 user_id 是否有效
     if user_id:
@@ -1991,7 +2108,7 @@ async def get_vehicle_options(
     )
 
 @app.get("/parking-management")
-async def get_parking_management_page(
+def get_parking_management_page(
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -1999,8 +2116,8 @@ async def get_parking_management_page(
     all_lots = db.scalars(select(ParkingLot).order_by(ParkingLot.name)).all()
     
     # (!!!) 1. 查詢新篩選器所需的資料 (!!!)
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
-    all_statuses = list(ParkingAssignmentType)
+    all_employees = _cached_options(db, "employees")
+    all_statuses = _PARKING_ASSIGNMENT_TYPE_CHOICES
 
     return templates.TemplateResponse(
         name="pages/parking_management.html",
@@ -2014,7 +2131,7 @@ async def get_parking_management_page(
     )
     
 @app.get("/parking-spots-list")
-async def get_parking_spots_list(
+def get_parking_spots_list(
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -2068,7 +2185,7 @@ async def get_parking_spots_list(
     )
 
 @app.get("/parking-spot/{spot_id}/assign")
-async def get_parking_assignment_form(
+def get_parking_assignment_form(
     request: Request,
     spot_id: UUID,
     db: Session = Depends(get_db)
@@ -2078,8 +2195,14 @@ async def get_parking_assignment_form(
     if not spot:
         raise HTTPException(status_code=404, detail="找不到該車位")
 
-    all_employees = db.scalars(select(Employee).order_by(Employee.name)).all()
-    all_vehicles = db.scalars(select(Vehicle).where(Vehicle.status == VehicleStatus.active).order_by(Vehicle.plate_no)).all()
+    all_employees = _cached_options(db, "employees")
+    # 下拉選單會顯示每台車的使用人，一併載入以免逐台查詢 (N+1)
+    all_vehicles = db.scalars(
+        select(Vehicle)
+        .where(Vehicle.status == VehicleStatus.active)
+        .options(joinedload(Vehicle.user))
+        .order_by(Vehicle.plate_no)
+    ).all()
 
     return templates.TemplateResponse(
         name="fragments/parking_assignment_form.html", # (我們將在下一步建立)
@@ -2092,14 +2215,14 @@ async def get_parking_assignment_form(
     )
 
 @app.post("/parking-spot/{spot_id}/assign")
-async def create_or_update_parking_assignment(
+def create_or_update_parking_assignment(
     request: Request,
     spot_id: UUID,
     db: Session = Depends(get_db),
     # 接收表單欄位
     assignment_type: ParkingAssignmentType = Form(...),
-    vehicle_id: Optional[str] = Form(None),
-    employee_id: Optional[str] = Form(None),
+    vehicle_id: OptionalUUIDForm = None,
+    employee_id: OptionalUUIDForm = None,
     private_plate_no: Optional[str] = Form(None),
     notes: Optional[str] = Form(None)
 ):
@@ -2117,15 +2240,15 @@ async def create_or_update_parking_assignment(
     spot.status = assignment_type
     spot.notes = notes
 
-    if assignment_type == ParkingAssignmentType.company_vehicle:
+    if assignment_type is ParkingAssignmentType.company_vehicle:
         if not vehicle_id:
             raise HTTPException(status_code=400, detail="必須選擇一輛公司車")
-        spot.assigned_vehicle_id = UUID(vehicle_id)
+        spot.assigned_vehicle_id = vehicle_id
 
-    elif assignment_type == ParkingAssignmentType.private_vehicle:
+    elif assignment_type is ParkingAssignmentType.private_vehicle:
         if not employee_id or not private_plate_no:
             raise HTTPException(status_code=400, detail="必須選擇私車車主並填寫車牌")
-        spot.assigned_employee_id = UUID(employee_id)
+        spot.assigned_employee_id = employee_id
         spot.private_plate_no = private_plate_no
 
     # (如果是 empty，就保持全部為 None)
@@ -2136,31 +2259,10 @@ async def create_or_update_parking_assignment(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"資料庫錯誤: {e}")
 
-    # 觸發列表刷新
-    # 1. 準備給 JavaScript 的 showToast 事件
-    toast_event = json.dumps({
-        "showToast": {
-            "message": "車位指派成功！", 
-            "level": "success",
-            "closeModal": True
-        }
-    })
-    
-    # 2. 準備給 HTMX 的 refreshParkingSpotsList 事件
-    htmx_trigger = "refreshParkingSpotsList"
-
-    # 3. 分別在不同的標頭中發送
-    headers = {
-        "HX-Trigger": htmx_trigger,             # 給 HTMX 監聽器
-        "HX-Trigger-After-Settle": toast_event   # 給 JavaScript 監聽器 (在Settle後觸發)
-    }
-    
-    print("!!!!!!!! 已發送分離的觸發器 !!!!!!!!")
-    
-    return Response(status_code=200, headers=headers)
+    return _saved_response("車位指派成功！", "refreshParkingSpotsList")
 
 @app.post("/parking-spot/{spot_id}/clear")
-async def clear_parking_assignment(
+def clear_parking_assignment(
     request: Request,
     spot_id: UUID,
     db: Session = Depends(get_db)
@@ -2190,7 +2292,7 @@ async def clear_parking_assignment(
 
 @app.get("/parking-lot/new")
 @app.get("/parking-lot/{lot_id}/edit")  # (!!!) 1. 加入這行 (!!!)
-async def get_parking_lot_form(
+def get_parking_lot_form(
     request: Request,
     lot_id: Optional[UUID] = None,  # (!!!) 2. 加入 lot_id (!!!)
     db: Session = Depends(get_db)
@@ -2210,7 +2312,7 @@ async def get_parking_lot_form(
 
 @app.post("/parking-lot/new")
 @app.post("/parking-lot/{lot_id}/edit")  # (!!!) 1. 加入這行 (!!!)
-async def create_or_update_parking_lot(  # (!!!) 2. 重新命名 (!!!)
+def create_or_update_parking_lot(  # (!!!) 2. 重新命名 (!!!)
     request: Request,
     db: Session = Depends(get_db),
     lot_id: Optional[UUID] = None,  # (!!!) 3. 加入 lot_id (!!!)
@@ -2263,7 +2365,7 @@ async def create_or_update_parking_lot(  # (!!!) 2. 重新命名 (!!!)
     return Response(status_code=200, headers=headers)
 
 @app.delete("/parking-lot/{lot_id}/delete")
-async def delete_parking_lot(
+def delete_parking_lot(
     lot_id: UUID,
     db: Session = Depends(get_db)
 ):
@@ -2296,28 +2398,8 @@ async def delete_parking_lot(
     }
     return Response(status_code=200, headers=headers)
 
-@app.get("/parking-lot/new")
-@app.get("/parking-lot/{lot_id}/edit")  # (!!!) 1. 加入這行 (!!!)
-async def get_parking_lot_form(
-    request: Request,
-    lot_id: Optional[UUID] = None,  # (!!!) 2. 加入 lot_id (!!!)
-    db: Session = Depends(get_db)
-):
-    """ 取得「新增停車場」的 Modal 表單 """
-    
-    lot = None
-    if lot_id:  # (!!!) 3. 加入這個 if 區塊 (!!!)
-        lot = db.get(ParkingLot, lot_id)
-        if not lot:
-            raise HTTPException(status_code=404, detail="找不到該停車場")
-            
-    return templates.TemplateResponse(
-        name="fragments/parking_lot_form.html",
-        context={"request": request, "lot": lot} # (!!!) 4. 傳遞 lot 物件 (!!!)
-    )
-
 @app.get("/parking-lot-list")
-async def get_parking_lot_list(
+def get_parking_lot_list(
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -2325,9 +2407,9 @@ async def get_parking_lot_list(
     
     lots = db.scalars(
         select(ParkingLot)
-        .options(joinedload(ParkingLot.spots)) # 載入車位 (用來計數)
+        .options(selectinload(ParkingLot.spots)) # 載入車位 (用來計數)；集合改用 IN 查詢，不需 .unique()
         .order_by(ParkingLot.name)
-    ).unique().all() # (!!!) 加上 .unique() 更保險 (!!!)
+    ).all()
             
     return templates.TemplateResponse(
         name="fragments/parking_lot_list.html", # (下一步建立這個檔案)
@@ -2336,7 +2418,7 @@ async def get_parking_lot_list(
 
 @app.get("/parking-spot/new")
 @app.get("/parking-spot/{spot_id}/edit")  # (!!!) 1. 加入這行 (!!!)
-async def get_parking_spot_form(
+def get_parking_spot_form(
     request: Request,
     spot_id: Optional[UUID] = None,  # (!!!) 2. 加入 spot_id (!!!)
     db: Session = Depends(get_db)
@@ -2362,11 +2444,11 @@ async def get_parking_spot_form(
 
 @app.post("/parking-spot/new")
 @app.post("/parking-spot/{spot_id}/edit")  # (!!!) 1. 加入這行 (!!!)
-async def create_or_update_parking_spot(  # (!!!) 2. 重新命名 (!!!)
+def create_or_update_parking_spot(  # (!!!) 2. 重新命名 (!!!)
     request: Request,
     db: Session = Depends(get_db),
     spot_id: Optional[UUID] = None,  # (!!!) 3. 加入 spot_id (!!!)
-    lot_id: str = Form(...),
+    lot_id: OptionalUUIDForm = None,
     spot_number: str = Form(...),
     description: Optional[str] = Form(None)
 ):
@@ -2374,7 +2456,6 @@ async def create_or_update_parking_spot(  # (!!!) 2. 重新命名 (!!!)
     if not lot_id:
         raise HTTPException(status_code=400, detail="必須選擇一個停車場")
         
-    lot_uuid = UUID(lot_id)
     
     # (!!!) 4. 檢查是新增還是編輯 (!!!)
     if spot_id:
@@ -2393,7 +2474,7 @@ async def create_or_update_parking_spot(  # (!!!) 2. 重新命名 (!!!)
     stmt = (
         select(ParkingSpot)
         .where(
-            (ParkingSpot.lot_id == lot_uuid) &
+            (ParkingSpot.lot_id == lot_id) &
             (ParkingSpot.spot_number == spot_number)
         )
     )
@@ -2405,7 +2486,7 @@ async def create_or_update_parking_spot(  # (!!!) 2. 重新命名 (!!!)
         raise HTTPException(status_code=400, detail="該停車場的車位編號已存在")
 
     # 更新欄位
-    spot.lot_id = lot_uuid
+    spot.lot_id = lot_id
     spot.spot_number = spot_number
     spot.description = description
 
@@ -2429,7 +2510,7 @@ async def create_or_update_parking_spot(  # (!!!) 2. 重新命名 (!!!)
     return Response(status_code=200, headers=headers)
 
 @app.delete("/parking-spot/{spot_id}/delete")
-async def delete_parking_spot(
+def delete_parking_spot(
     spot_id: UUID,
     db: Session = Depends(get_db)
 ):
@@ -2452,37 +2533,59 @@ async def delete_parking_spot(
     # 刪除成功，HTMX 會自動移除該行，不需要回傳 HX-Trigger
     return Response(status_code=200)
 
+# --- 資料匯入/匯出 ---
+# 資料類型 → 範本檔名 / import_data 中的匯入函式名稱，載入時建好一次
+IMPORT_TEMPLATE_FILES = MappingProxyType({
+    "employees": "import_employees.csv",
+    "vehicles": "import_vehicles.csv",
+    "maintenance": "import_maintenance.csv",
+    "inspections": "import_inspections.csv",
+    "fees": "import_fees.csv",
+    "disposals": "import_disposals.csv",
+    "asset_log": "import_asset_log.csv",
+    "parking_lots": "import_parking_lots.csv",
+    "parking_spots": "import_parking_spots.csv",
+})
+IMPORT_FUNC_NAMES = MappingProxyType({
+    "employees": "import_employees",
+    "vehicles": "import_vehicles",
+    "maintenance": "import_maintenance",
+    "inspections": "import_inspections",
+    "fees": "import_fees",
+    "disposals": "import_disposals",
+    "asset_log": "import_asset_log",
+    "parking_lots": "import_parking_lots",
+    "parking_spots": "import_parking_spots",
+})
+IMPORT_ALLOWED_SUFFIXES = frozenset({".csv", ".xlsx", ".xls"})
+
+# import_data 的快取 (VEHICLE_CACHE 等) 是模組全域變數，同一時間只允許一個匯入
+_IMPORT_LOCK = threading.Lock()
+
+def _run_import(import_data, import_function, file_path):
+    try:
+        with _IMPORT_LOCK, import_data.session_scope() as session:
+            import_function(session, file_path)
+    finally:
+        # 匯入可能順帶新增員工或車輛 (例如依姓名建立使用人)
+        _bump_options("employees", "vehicles")
+
 @app.get("/import-export-management")
-async def get_import_export_page(request: Request):
+async def get_import_export_page():
     """
     渲染「資料匯入/匯出」的主頁面。
     """
-    return templates.TemplateResponse(
-        name="pages/import_export.html",
-        context={"request": request}
-    )
+    return HTMLResponse(_render_static("pages/import_export.html"))
 
 @app.get("/download/template/{template_name}")
-async def download_template(template_name: str):
+def download_template(template_name: str):
     """
     提供範本 CSV 檔案下載。
     """
-    safe_name_map = {
-        "employees": "import_employees.csv",
-        "vehicles": "import_vehicles.csv",
-        "maintenance": "import_maintenance.csv",
-        "inspections": "import_inspections.csv",
-        "fees": "import_fees.csv",
-        "disposals": "import_disposals.csv",
-        "asset_log": "import_asset_log.csv",
-        "parking_lots": "import_parking_lots.csv",      # (!!!) 新增 (!!!)
-        "parking_spots": "import_parking_spots.csv"  # (!!!) 新增 (!!!)
-    }
-    
-    if template_name not in safe_name_map:
+    file_name = IMPORT_TEMPLATE_FILES.get(template_name)
+    if file_name is None:
         raise HTTPException(status_code=404, detail="Template not found")
-    
-    file_name = safe_name_map[template_name]
+
     file_path = Path("import_templates") / file_name
     
     if not file_path.exists():
@@ -2497,7 +2600,7 @@ async def download_template(template_name: str):
     )
 
 @app.post("/upload/import-data")
-async def upload_import_data(
+def upload_import_data(
     request: Request,
     data_type: str = Form(...),
     file: UploadFile = File(...)
@@ -2509,26 +2612,18 @@ async def upload_import_data(
     """
     
     # 1. 檢查檔案類型
-    allowed_suffixes = [".csv", ".xlsx", ".xls"]
-    file_suffix = Path(file.filename).suffix.lower()
-    if file_suffix not in allowed_suffixes:
+    file_suffix = os.path.splitext(file.filename)[1].lower()
+    if file_suffix not in IMPORT_ALLOWED_SUFFIXES:
         raise HTTPException(status_code=400, detail=f"不支援的檔案格式: {file_suffix}。僅支援 .csv, .xlsx, .xls")
 
     # 2. 匯入函式地圖 (!!!) 這是關鍵 (!!!)
-    import_func_map = {
-        "employees": import_data.import_employees,
-        "vehicles": import_data.import_vehicles,
-        "maintenance": import_data.import_maintenance,
-        "inspections": import_data.import_inspections,
-        "fees": import_data.import_fees,
-        "disposals": import_data.import_disposals,
-        "asset_log": import_data.import_asset_log,
-        "parking_lots": import_data.import_parking_lots,      # (!!!) 新增 (!!!)
-        "parking_spots": import_data.import_parking_spots  # (!!!) 新增 (!!!)
-    }
-
-    if data_type not in import_func_map:
+    func_name = IMPORT_FUNC_NAMES.get(data_type)
+    if func_name is None:
         raise HTTPException(status_code=400, detail="無效的資料類型")
+
+    # import_data 會載入 pandas，只有真的要匯入時才載入，
+    # 避免拖慢每個 worker 的啟動時間
+    import import_data
     
     # 3. 建立一個安全的暫存檔案路徑
     # 我們將檔案儲存在 UPLOAD_PATH 中，以確保
@@ -2536,18 +2631,16 @@ async def upload_import_data(
     temp_file_path = UPLOAD_PATH / temp_filename
 
     try:
-        # 4. 儲存上傳的檔案到暫存位置
-        with temp_file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # 4. 儲存上傳的檔案到暫存位置 (與附件上傳共用同一個寫檔函式)
+        _write_upload(file.file, temp_file_path)
         
         # 5. 取得要呼叫的函式
-        import_function = import_func_map[data_type]
+        import_function = getattr(import_data, func_name)
         
         # 6. (!!!) 執行匯入 (!!!)
         # 我們使用 import_data.py 自己的 session_scope
         # 並將「暫存檔案的路徑」傳遞過去
-        with import_data.session_scope() as session:
-            import_function(session, temp_file_path)
+        _run_import(import_data, import_function, temp_file_path)
         
         message = f"成功匯入 {file.filename} ({data_type}) 資料！"
         level = "success"
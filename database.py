@@ -0,0 +1,27 @@
+# database.py
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+
+# --- DB 連線與 Session ---
+# app 與 import_data 共用這一個 engine，一個程序只會有一個連線池
+engine = create_engine(
+    settings.DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_use_lifo=True,  # 優先重用最近用過的連線，閒置連線可以自然被回收
+)
+# 每個請求的 session 在回應後就關閉；commit 後不必把物件標為過期，
+# 之後讀取屬性 (例如新紀錄的 id) 不會再多一次 SELECT 重新載入
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,8 +1,12 @@
 # import_data.py
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import insert
 from sqlalchemy.orm import sessionmaker, scoped_session
-from config import settings
+from database import engine
+from labels import (
+    VEHICLE_TYPE_MAP, VEHICLE_STATUS_MAP, MAINTENANCE_CATEGORY_MAP,
+    INSPECTION_KIND_MAP, FEE_TYPE_MAP, ASSET_TYPE_MAP, ASSET_STATUS_MAP
+)
 from models import (
     Base, Vehicle, Maintenance, Inspection, Fee, Disposal, Employee, 
     VehicleAssetLog, AssetType, AssetStatus,
@@ -13,8 +17,7 @@ import re
 from contextlib import contextmanager
 from pathlib import Path
 
-# --- 資料庫連線 ---
-engine = create_engine(settings.DATABASE_URL)
+# --- 資料庫連線 (與 app 共用 database.py 的 engine / 連線池) ---
 session_factory = sessionmaker(bind=engine)
 Session = scoped_session(session_factory)
 
@@ -24,53 +27,17 @@ EMPLOYEE_CACHE = {}
 PARKING_LOT_CACHE = {}
 
 # (!!!) 1. 建立反向翻譯字典 (!!!)
-REVERSE_VEHICLE_TYPE_MAP = {
-    "小客車": VehicleType.car,
-    "機車": VehicleType.motorcycle,
-    "廂型車": VehicleType.van,
-    "貨車": VehicleType.truck,
-    "電動機車": VehicleType.ev_scooter,
-}
-REVERSE_VEHICLE_STATUS_MAP = {
-    "啟用中": VehicleStatus.active,
-    "維修中": VehicleStatus.maintenance,
-    "已報廢": VehicleStatus.retired,
-}
-REVERSE_MAINTENANCE_MAP = {
-    "定期保養": MaintenanceCategory.maintenance,
-    "維修": MaintenanceCategory.repair,
-    "一般洗車": MaintenanceCategory.carwash,
-    "手工洗車": MaintenanceCategory.deep_cleaning,
-    "淨車": MaintenanceCategory.ritual_cleaning,
-}
-REVERSE_INSPECTION_MAP = {
-    "定期檢驗": InspectionKind.periodic,
-    "排氣檢驗": InspectionKind.emission,
-    "複檢": InspectionKind.reinspection,
-}
-REVERSE_FEE_TYPE_MAP = {
-    "加油費": FeeType.fuel_fee,
-    "停車費": FeeType.parking,
-    "保養服務": FeeType.maintenance_service,
-    "維修零件": FeeType.repair_parts,
-    "檢驗費": FeeType.inspection_fee,
-    "用品/雜項": FeeType.supplies,
-    "E-Tag/過路費": FeeType.toll,
-    "稅金": FeeType.license_tax,
-    "其他": FeeType.other,
-}
-REVERSE_ASSET_TYPE_MAP = {
-    "鑰匙": AssetType.key,
-    "行車紀錄器": AssetType.dashcam,
-    "E-Tag": AssetType.etag,
-    "其他": AssetType.other,
-}
-REVERSE_ASSET_STATUS_MAP = {
-    "已指派": AssetStatus.assigned,
-    "已歸還": AssetStatus.returned,
-    "遺失": AssetStatus.lost,
-    "已報廢/處理": AssetStatus.disposed,
-}
+# 由 labels.py 的正向翻譯反轉而來 (中文 -> enum)，不再另外維護一份
+def _reverse_map(enum_cls, label_map):
+    return {label: enum_cls(value) for value, label in label_map.items()}
+
+REVERSE_VEHICLE_TYPE_MAP = _reverse_map(VehicleType, VEHICLE_TYPE_MAP)
+REVERSE_VEHICLE_STATUS_MAP = _reverse_map(VehicleStatus, VEHICLE_STATUS_MAP)
+REVERSE_MAINTENANCE_MAP = _reverse_map(MaintenanceCategory, MAINTENANCE_CATEGORY_MAP)
+REVERSE_INSPECTION_MAP = _reverse_map(InspectionKind, INSPECTION_KIND_MAP)
+REVERSE_FEE_TYPE_MAP = _reverse_map(FeeType, FEE_TYPE_MAP)
+REVERSE_ASSET_TYPE_MAP = _reverse_map(AssetType, ASSET_TYPE_MAP)
+REVERSE_ASSET_STATUS_MAP = _reverse_map(AssetStatus, ASSET_STATUS_MAP)
 
 
 @contextmanager
@@ -187,6 +154,11 @@ def get_parking_lot_id(session, name):
         return new_lot.id
 
 # --- 清理資料的輔助函式 ---
+def bulk_insert(session, model, rows):
+    """整批寫入 (多筆 INSERT 合併成少數幾個多列 VALUES 語句，而不是逐筆往返)"""
+    if rows:
+        session.execute(insert(model), rows)
+
 def clean_date(date_obj):
     date_str = clean_string(date_obj)
     if not date_str: return None
@@ -272,6 +244,9 @@ def import_vehicles(session, file_path: str | Path):
 def import_maintenance(session, file_path: str | Path):
     print("--- 2. 開始匯入保養維修 ---")
     df = load_dataframe(file_path)
+    # 先收集成 dict，迴圈結束後整批寫入
+    # (逐筆 session.add 時，下一列查車牌/員工的 autoflush 會讓每筆各自 INSERT)
+    maint_rows, fee_rows = [], []
     for _, row in df.iterrows():
         vehicle_id = get_vehicle_id(session, row.get('vehicle_plate_no'))
         if not vehicle_id:
@@ -281,7 +256,7 @@ def import_maintenance(session, file_path: str | Path):
         user_id = get_user_id(session, row.get('user_name'))
         handler_id = get_user_id(session, row.get('handler_name'))
         
-        new_maint = Maintenance(
+        new_maint = dict(
             vehicle_id=vehicle_id, 
             user_id=user_id, 
             handler_id=handler_id,
@@ -297,33 +272,35 @@ def import_maintenance(session, file_path: str | Path):
             notes=clean_string(row.get('notes')),
             handler_notes=clean_string(row.get('handler_notes'))
         )
-        session.add(new_maint)
+        maint_rows.append(new_maint)
         
         # 自動建立費用的邏輯 (保持不變)
         amount = clean_numeric(row.get('amount'))
         if amount and amount > 0:
             fee_type = FeeType.maintenance_service
-            if new_maint.category == MaintenanceCategory.repair:
+            if new_maint['category'] == MaintenanceCategory.repair:
                 fee_type = FeeType.repair_parts
             fee_user_id = handler_id if handler_id else user_id
             if not fee_user_id:
                 print(f"  [自動] 警告: {clean_string(row.get('vehicle_plate_no'))} 的費用單缺少請款人。")
-            new_fee = Fee(
+            fee_rows.append(dict(
                 vehicle_id=vehicle_id, user_id=fee_user_id,
-                receive_date=new_maint.performed_on, 
-                request_date=new_maint.performed_on, 
+                receive_date=new_maint['performed_on'], 
+                request_date=new_maint['performed_on'], 
                 fee_type=fee_type, amount=amount,
-                is_paid=new_maint.is_reconciled, 
+                is_paid=new_maint['is_reconciled'], 
                 notes=f"自動建立 - {row.get('category')}: {row.get('notes') or ''}"
-            )
-            session.add(new_fee)
+            ))
             print(f"  [自動] 為 {clean_string(row.get('vehicle_plate_no'))} 建立 ${amount} 的費用單。")
             
+    bulk_insert(session, Maintenance, maint_rows)
+    bulk_insert(session, Fee, fee_rows)
     print("--- 保養維修匯入完成 ---")
 
 def import_inspections(session, file_path: str | Path):
     print("--- 3. 開始匯入檢驗 ---")
     df = load_dataframe(file_path)
+    insp_rows, fee_rows = [], [] # 同保養：迴圈結束後整批寫入
     for _, row in df.iterrows():
         vehicle_id = get_vehicle_id(session, row.get('vehicle_plate_no'))
         if not vehicle_id:
@@ -333,7 +310,7 @@ def import_inspections(session, file_path: str | Path):
         user_id = get_user_id(session, row.get('user_name'))
         handler_id = get_user_id(session, row.get('handler_name'))
 
-        new_insp = Inspection(
+        new_insp = dict(
             vehicle_id=vehicle_id, 
             user_id=user_id, 
             handler_id=handler_id,
@@ -351,7 +328,7 @@ def import_inspections(session, file_path: str | Path):
             notes=clean_string(row.get('notes')),
             handler_notes=clean_string(row.get('handler_notes'))
         )
-        session.add(new_insp)
+        insp_rows.append(new_insp)
 
         # 自動建立費用的邏輯 (保持不變)
         amount = clean_numeric(row.get('amount'))
@@ -359,17 +336,18 @@ def import_inspections(session, file_path: str | Path):
             fee_user_id = handler_id if handler_id else user_id
             if not fee_user_id:
                 print(f"  [自動] 警告: {clean_string(row.get('vehicle_plate_no'))} 的檢驗費用單缺少請款人。")
-            new_fee = Fee(
+            fee_rows.append(dict(
                 vehicle_id=vehicle_id, user_id=fee_user_id,
-                receive_date=new_insp.inspected_on or new_insp.notification_date,
-                request_date=new_insp.inspected_on or new_insp.notification_date,
+                receive_date=new_insp['inspected_on'] or new_insp['notification_date'],
+                request_date=new_insp['inspected_on'] or new_insp['notification_date'],
                 fee_type=FeeType.inspection_fee,
-                amount=amount, is_paid=new_insp.is_reconciled,
+                amount=amount, is_paid=new_insp['is_reconciled'],
                 notes=f"自動建立 - 檢驗費: {row.get('kind')}"
-            )
-            session.add(new_fee)
+            ))
             print(f"  [自動] 為 {clean_string(row.get('vehicle_plate_no'))} 建立 ${amount} 的檢驗費用單。")
             
+    bulk_insert(session, Inspection, insp_rows)
+    bulk_insert(session, Fee, fee_rows)
     print("--- 檢驗匯入完成 ---")
 
 def import_fees(session, file_path: str | Path):
@@ -0,0 +1,60 @@
+# labels.py
+# 所有 enum 值的中文翻譯 (app.py、models.py、import_data.py 共用同一份)
+# 以 MappingProxyType 包裝成唯讀，避免執行期間被意外修改
+from types import MappingProxyType
+
+VEHICLE_TYPE_MAP = MappingProxyType({
+    "car": "小客車", "motorcycle": "機車", "van": "廂型車",
+    "truck": "貨車", "ev_scooter": "電動機車",
+})
+VEHICLE_STATUS_MAP = MappingProxyType({
+    "active": "啟用中", "maintenance": "維修中", "retired": "已報廢",
+})
+
+MAINTENANCE_CATEGORY_MAP = MappingProxyType({
+    "maintenance": "定期保養",
+    "repair": "維修",
+    "carwash": "一般洗車",
+    "deep_cleaning": "手工洗車",
+    "ritual_cleaning": "淨車",
+})
+
+INSPECTION_KIND_MAP = MappingProxyType({
+    "periodic": "定期檢驗",
+    "emission": "排氣檢驗",
+    "reinspection": "複檢",
+})
+
+FEE_TYPE_MAP = MappingProxyType({
+    "fuel_fee": "加油費",
+    "parking": "停車費",
+    "maintenance_service": "保養服務",
+    "repair_parts": "維修零件",
+    "inspection_fee": "檢驗費",
+    "supplies": "用品/雜項",
+    "toll": "E-Tag/過路費",
+    "license_tax": "稅金",
+    "other": "其他",
+})
+
+# 資產類型翻譯字典
+ASSET_TYPE_MAP = MappingProxyType({
+    "key": "鑰匙",
+    "dashcam": "行車紀錄器",
+    "etag": "E-Tag",
+    "other": "其他",
+})
+
+# 資產狀態翻譯字典
+ASSET_STATUS_MAP = MappingProxyType({
+    "assigned": "已指派",
+    "returned": "已歸還",
+    "lost": "遺失",
+    "disposed": "已報廢/處理",
+})
+
+PARKING_STATUS_MAP = MappingProxyType({
+    "empty": "空位",
+    "company_vehicle": "公司車",
+    "private_vehicle": "私車",
+})
@@ -3,7 +3,7 @@ from datetime import datetime
 from uuid import uuid4
 from sqlalchemy import (
 Column, String, Integer, Date, DateTime, Numeric, Text,
-ForeignKey, Enum, Boolean
+ForeignKey, Enum, Boolean, Index
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base, relationship
@@ -12,17 +12,9 @@ import enum
 from dateutil.relativedelta import relativedelta
 from pydantic import BaseModel
 
-Base = declarative_base()
+from labels import VEHICLE_TYPE_MAP
 
-# (!!!) 1. 為了讓 Vehicle.__str__ 能運作，將翻譯字典搬移到此 (!!!)
-# (!!!) (這不會影響 admin_views.py，那裡會保留自己的版本) (!!!)
-_VEHICLE_TYPE_MAP_FOR_MODEL = {
-    "car": "小客車",
-    "motorcycle": "機車",
-    "van": "廂型車",
-    "truck": "貨車",
-    "ev_scooter": "電動機車",
-}
+Base = declarative_base()
 
 # --- 核心模型 (員工) ---
 class Employee(Base):
@@ -76,8 +68,9 @@ class Vehicle(Base):
     asset_logs = relationship("VehicleAssetLog", back_populates="vehicle", cascade="all, delete-orphan")
 
     def __str__(self) -> str:
-        key = str(self.vehicle_type).split(".")[-1]
-        vt = _VEHICLE_TYPE_MAP_FOR_MODEL.get(key, key)
+        # 直接取 enum 的 .value，不必先組出 "VehicleType.car" 再切字串
+        key = getattr(self.vehicle_type, "value", self.vehicle_type)
+        vt = VEHICLE_TYPE_MAP.get(key, key)
         parts = [self.plate_no, vt, self.model or None]
         return " / ".join(filter(None, parts))
 
@@ -109,6 +102,11 @@ class VehicleAssetLog(Base):
     log_date = Column(Date, nullable=False, info={"label": "紀錄日期"}) 
     notes = Column(Text, nullable=True, info={"label": "備註"})
 
+    # 單一車輛的資產日誌依日期倒序
+    __table_args__ = (
+        Index("ix_asset_logs_vehicle_log_date", vehicle_id, log_date.desc()),
+    )
+
 Employee.asset_logs = relationship("VehicleAssetLog", back_populates="user")
 
 # --- (v12) 保養維修 (事件) ---
@@ -151,6 +149,12 @@ class Maintenance(Base):
     
     vehicle = relationship("Vehicle", back_populates="maintenance")
 
+    # 對應列表的 WHERE + ORDER BY：單一車輛依 vehicle_id 篩選、依執行日期倒序；全部列表直接依執行日期排序
+    __table_args__ = (
+        Index("ix_maintenance_vehicle_performed_on", vehicle_id, performed_on.desc()),
+        Index("ix_maintenance_performed_on", performed_on.desc()),
+    )
+
 Employee.maintenance_user_records = relationship("Maintenance", foreign_keys=[Maintenance.user_id], back_populates="user")
 Employee.maintenance_handler_records = relationship("Maintenance", foreign_keys=[Maintenance.handler_id], back_populates="handler")
 
@@ -194,6 +198,10 @@ class Inspection(Base):
 
     vehicle = relationship("Vehicle", back_populates="inspections")
 
+    __table_args__ = (
+        Index("ix_inspections_vehicle_inspected_on", vehicle_id, inspected_on.desc()),
+    )
+
 Employee.inspection_user_records = relationship("Inspection", foreign_keys=[Inspection.user_id], back_populates="user")
 Employee.inspection_handler_records = relationship("Inspection", foreign_keys=[Inspection.handler_id], back_populates="handler")
 
@@ -236,6 +244,10 @@ class Fee(Base):
     vehicle = relationship("Vehicle", back_populates="fees")
     user = relationship("Employee", foreign_keys=[user_id], back_populates="fee_records")
 
+    __table_args__ = (
+        Index("ix_fees_vehicle_receive_date", vehicle_id, receive_date.desc()),
+    )
+
 Employee.fee_records = relationship("Fee", foreign_keys=[Fee.user_id], back_populates="user")
 
 # --- (v6) 報廢 ---
@@ -278,6 +290,11 @@ class Attachment(Base):
     description = Column(Text, nullable=True, info={"label": "檔案說明"})
     uploaded_at = Column(DateTime, default=datetime.utcnow, info={"label": "上傳時間"})
 
+    # 附件管理視窗依 (entity_type, entity_id) 查詢
+    __table_args__ = (
+        Index("ix_attachments_entity", entity_type, entity_id),
+    )
+
 class ParkingAssignmentType(str, enum.Enum):
     empty = "empty"             # 空位
     company_vehicle = "company_vehicle" # 公司車
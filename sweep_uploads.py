@@ -0,0 +1,20 @@
+# sweep_uploads.py
+# 維護指令：清理已沒有附件紀錄引用的上傳檔 (需手動執行：python sweep_uploads.py)
+from sqlalchemy import select
+from app import UPLOAD_PATH, remove_unreferenced_upload
+from database import SessionLocal
+from models import Attachment
+
+if __name__ == "__main__":
+    with SessionLocal() as db:
+        # 附件資料表是空的多半是連錯資料庫，整批跳過，避免把所有上傳檔當成孤兒刪掉
+        if db.scalar(select(Attachment.id).limit(1)) is None:
+            print("附件資料表沒有任何紀錄，略過清理。")
+        else:
+            # 只會刪除內容雜湊命名、沒有紀錄引用且超過寬限時間的檔案
+            removed = 0
+            for path in sorted(UPLOAD_PATH.iterdir()):
+                if path.is_file() and remove_unreferenced_upload(db, path.name):
+                    print(f"  [刪除] {path.name}")
+                    removed += 1
+            print(f"--- 清理完成，共刪除 {removed} 個檔案 ---")